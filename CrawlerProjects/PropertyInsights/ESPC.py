@@ -3,12 +3,23 @@ from __future__ import annotations
 from bs4 import BeautifulSoup
 import requests
 from utils import HEADERS
-from typing import List, Tuple
+import profiling
+from typing import Callable, Iterator, List, Tuple
+from collections import OrderedDict, deque
 import re
 import multiprocessing as mp
 import time
 
 
+def canonical_property_url(url: str) -> str:
+    """
+    The url may be appended by some unknown values which directs to the same site.
+    Get rid of them because the url will be used as a unique key for search
+    :return The url without its query string
+    """
+    return url.split("?")[0]
+
+
 def get_html_from_url(url: str) -> str:
     """
     Get the html from a given url
@@ -26,6 +37,17 @@ def get_html_from_url(url: str) -> str:
         raise requests.RequestException(f"Encounter {e} for url={url}")
 
 
+def print_error(url: str, stage: str, error: Exception) -> None:
+    """
+    Default error callback, which only reports the error
+    :param url: The property url
+    :param stage: Name of the stage which failed, e.g., "detail"
+    :param error: The exception encountered
+    """
+    print("############################ERROR HAPPEN############################")
+    print(f"Stage {stage} failed for property url={url}: {error}")
+
+
 class ESPCPropertyInfo:
     """
     A class that stores all important information about a property
@@ -134,9 +156,7 @@ class ESPCPropertyInfo:
         else:
             epc = epc[0].text
 
-        # The url may be appended by some unknown values which directs to the same site.
-        # Get rid of them because the url will be used as a unique key for search
-        url = url.split("?")[0]
+        url = canonical_property_url(url)
 
         obj = cls(
             price_type=price_type,
@@ -156,12 +176,25 @@ class ESPCPropertyInfo:
         return obj
 
 
+def init_from_url_or_exception(url: str) -> ESPCPropertyInfo | Exception:
+    """
+    Same as ESPCPropertyInfo.init_from_url, but returns the exception instead of raising it so that one bad property
+    does not discard the other results of a pool
+    :return An ESPCPropertyInfo object, or the exception encountered
+    """
+    try:
+        return ESPCPropertyInfo.init_from_url(url)
+    except Exception as e:
+        return e
+
+
 class ESPCCrawler:
     """
     A class used to send request and parse its results from espc.com
     """
 
-    def __init__(self, location: str, min_beds: str, max_price: str, property_type: str, use_mp: bool = True):
+    def __init__(self, location: str, min_beds: str, max_price: str, property_type: str, use_mp: bool = True,
+                 start_page: int = 1, cache_size: int = 32):
         """
         Constructor
         :param location: locations parameter (constraint) for url of the GET request of espc.com
@@ -169,14 +202,21 @@ class ESPCCrawler:
         :param max_price: maxprice parameter (constraint) for url of the GET request of espc.com
         :param property_type: ptype parameter (constraint) for url of the GET request of espc.com:
         :param use_mp: Whether to use multiple processing
+        :param start_page: The page the iterator starts from
+        :param cache_size: Maximum number of pages whose parsed property urls are kept (least recently used evicted)
         """
         self.__location = location  # type: str
         self.__min_beds = min_beds  # type: str
         self.__max_price = max_price  # type: str
         self.__property_type = property_type  # type: str
         self.__use_mp = use_mp  # type: bool
+        self.__start_page = start_page  # type: int
+        self.__cache_size = cache_size  # type: int
+        self.__page_cache = OrderedDict()  # type: OrderedDict[int, List[str]]
+        # All property urls of the search in order, once all pages have been discovered
+        self.__index = None  # type: List[str]
         # This is a flag for iterator
-        self.__i = 1  # type: int
+        self.__i = start_page  # type: int
 
     def __build_espc_page_url(self, page: int) -> str:
         """
@@ -204,7 +244,7 @@ class ESPCCrawler:
         """
         soup = BeautifulSoup(html, 'lxml')
         parse = soup.select("div.infoWrap > a")
-        urls = [f"https://espc.com{url.get('href')}" for url in parse]
+        urls = [canonical_property_url(f"https://espc.com{url.get('href')}") for url in parse]
 
         return urls
 
@@ -235,8 +275,130 @@ class ESPCCrawler:
         except requests.RequestException as e:
             raise f"Encounter {e} on espc.com page={page}, url={page_url}"
 
+    def get_property_urls_on_page(self, page: int) -> List[str]:
+        """
+        Get all property urls on a certain page. The page is only requested and parsed if it is not in the cache
+        :param page: The page parameter in url request
+        :return List of all property urls of the page, empty if the page is invalid (i.e., beyond the last page)
+        """
+        if page in self.__page_cache:
+            self.__page_cache.move_to_end(page)
+            return list(self.__page_cache[page])
+
+        html = self.get_html_from_page_num(page)
+        property_urls = self.parse_all_property_urls_from_page_html(html) if self.is_valid_page(html) else []
+
+        self.__page_cache[page] = property_urls
+        if self.__page_cache.__len__() > self.__cache_size:
+            self.__page_cache.popitem(last=False)
+
+        return list(property_urls)
+
+    def build_index(self) -> List[str]:
+        """
+        Discover all pages of the search (listing requests only, no detail request), once
+        :return All property urls of the search in order, as listed (i.e., including duplication due to advertisement)
+        """
+        if self.__index is None:
+            index = []
+            page = 1
+            while True:
+                property_urls = self.get_property_urls_on_page(page)
+                if not property_urls:
+                    break
+                index.extend(property_urls)
+                page += 1
+            self.__index = index
+
+        return self.__index
+
+    def fetch_property_infos(self, property_urls: List[str],
+                             return_exceptions: bool = False) -> List[ESPCPropertyInfo | Exception]:
+        """
+        Get the ESPCPropertyInfo objects of the given property urls
+        :param property_urls: List of property urls
+        :param return_exceptions: Whether to return the exception of a failed property in its place instead of raising
+        :return A list of ESPCPropertyInfo objects (or exceptions), in the same order as property_urls
+        """
+        func = init_from_url_or_exception if return_exceptions else ESPCPropertyInfo.init_from_url
+        if self.__use_mp and property_urls:
+            # Use multiple processing to speed up
+            pool = mp.Pool(mp.cpu_count(), initializer=profiling.init_worker)
+            all_property_infos = pool.map(func, property_urls)
+            # Once all the tasks have been completed the worker processes will exit.
+            pool.close()
+            pool.join()
+        else:
+            all_property_infos = [func(url) for url in property_urls]
+
+        return all_property_infos
+
+    def iter_property_infos(self, max_in_flight: int = None,
+                            on_error: Callable[[str, str, Exception], None] = None) -> Iterator[ESPCPropertyInfo]:
+        """
+        Yield the ESPCPropertyInfo objects of all pages one at a time, in order. Only the urls of the current page and
+        at most max_in_flight pending detail requests are held, so memory does not grow with the number of pages.
+        A property whose detail page fails is skipped and reported to on_error
+        :param max_in_flight: Maximum number of detail requests sent but not yet yielded, defaults to twice the CPU
+        count with multiple processing
+        :param on_error: Called as on_error(url, "detail", exception) for each failed property, e.g.,
+        CrawlJournal.record_failure. Defaults to printing the error
+        :return An iterator of ESPCPropertyInfo objects
+        """
+        on_error = on_error or print_error
+        pool = mp.Pool(mp.cpu_count(), initializer=profiling.init_worker) if self.__use_mp else None
+        max_in_flight = max_in_flight or (2 * mp.cpu_count() if self.__use_mp else 1)
+        pending = deque()  # (url, result) of the requests sent, in order
+        page = self.__start_page
+        try:
+            while True:
+                property_urls = self.get_property_urls_on_page(page)
+                if not property_urls:
+                    break
+
+                for url in property_urls:
+                    if pool is None:
+                        pending.append((url, init_from_url_or_exception(url)))
+                    else:
+                        pending.append((url, pool.apply_async(init_from_url_or_exception, (url,))))
+
+                    while pending.__len__() >= max_in_flight:
+                        property_info = self.__pop_result(pending, on_error)
+                        if property_info is not None:
+                            yield property_info
+                page += 1
+
+            while pending:
+                property_info = self.__pop_result(pending, on_error)
+                if property_info is not None:
+                    yield property_info
+        finally:
+            if pool is not None:
+                if pending:
+                    # Also stops the pending requests if the iteration is abandoned
+                    pool.terminate()
+                else:
+                    # Let the workers exit normally, e.g., to write their profiles
+                    pool.close()
+                pool.join()
+
+    @staticmethod
+    def __pop_result(pending: deque, on_error: Callable[[str, str, Exception], None]) -> ESPCPropertyInfo | None:
+        """
+        Pop the oldest request sent by iter_property_infos and wait for its result
+        :return The ESPCPropertyInfo object, or None if it failed
+        """
+        url, result = pending.popleft()
+        if not isinstance(result, (ESPCPropertyInfo, Exception)):
+            result = result.get()
+        if isinstance(result, Exception):
+            on_error(url, "detail", result)
+            return None
+
+        return result
+
     def __iter__(self) -> ESPCCrawler:
-        self.__i = 1
+        self.__i = self.__start_page
         return self
 
     def __next__(self) -> List[ESPCPropertyInfo]:
@@ -244,38 +406,45 @@ class ESPCCrawler:
         This allows get a list of ESPCPropertyInfo objects as on current page and increase page number
         :return A list of ESPCPropertyInfo objects shown on the current page
         """
-        page = self.__i
-        html = self.get_html_from_page_num(page)
-        if self.is_valid_page(html):
-            property_urls = self.parse_all_property_urls_from_page_html(html)
-
-            if self.__use_mp:
-                # Use multiple processing to speed up
-                pool = mp.Pool(mp.cpu_count())
-                all_property_infos = pool.map(ESPCPropertyInfo.init_from_url, property_urls)
-                # Once all the tasks have been completed the worker processes will exit.
-                pool.close()
-                pool.join()
-            else:
-                all_property_infos = [ESPCPropertyInfo.init_from_url(url) for url in property_urls]
+        property_urls = self.get_property_urls_on_page(self.__i)
+        if property_urls:
+            all_property_infos = self.fetch_property_infos(property_urls)
 
             self.__i += 1
             return all_property_infos
         else:
             raise StopIteration
 
-    def __getitem__(self, args: Tuple[int, int]) -> ESPCPropertyInfo:
+    def property_count(self) -> int:
+        """
+        Number of properties of the search, see build_index. Requests every listing page on the first call. Not a
+        __len__ on purpose: the iteration is over pages, and len() is called implicitly, e.g., by bool(obj) or list(obj)
+        :return The number of properties
+        """
+        return self.build_index().__len__()
+
+    def __getitem__(self, args: Tuple[int, int] | int | slice) -> ESPCPropertyInfo | List[ESPCPropertyInfo]:
         """
-        Get the i-th property as ESPCPropertyInfo object on a certain page
-        :param args: Index for i-th property and page number in the format of (i, page)
-        :return The i-th property as ESPCPropertyInfo object on a certain page
+        Get the i-th property as ESPCPropertyInfo object on a certain page, or by its position in the whole search.
+        The property urls of a page are cached, so only the detail is requested after the first access to a page
+        :param args: Index for i-th property and page number in the format of (i, page), with i starting from 1.
+        Or an index (starting from 0) or a slice over all properties of the search, see build_index
+        :return The ESPCPropertyInfo object, or a list of them for a slice
         """
+        if isinstance(args, slice):
+            return self.fetch_property_infos(self.build_index()[args])
+        elif isinstance(args, int):
+            try:
+                url = self.build_index()[args]
+            except IndexError:
+                raise IndexError(f"Unable to get {args}-th property of {self.property_count()} properties")
+            return ESPCPropertyInfo.init_from_url(url)
+
         i, page = args
         i -= 1  # Array index starts from 0
-        html = self.get_html_from_page_num(page)
-        if self.is_valid_page(html):
+        property_urls = self.get_property_urls_on_page(page)
+        if property_urls:
             try:
-                property_urls = self.parse_all_property_urls_from_page_html(html)
                 property_info = ESPCPropertyInfo.init_from_url(property_urls[i])
                 return property_info
             except IndexError:
@@ -1,13 +1,20 @@
+from __future__ import annotations
+
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
-from selenium import webdriver
+import requests
+from requests.adapters import HTTPAdapter
 import getpass
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support.ui import WebDriverWait as WAIT
-from typing import Tuple, List
+from typing import Tuple, List, Iterable, TYPE_CHECKING
+from utils import HEADERS
+
+# selenium and pandas are slow to import, so they are only imported where used
+if TYPE_CHECKING:
+    import pandas as pd
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.remote.webdriver import WebDriver
 
 
 class SIMDInfo:
@@ -101,6 +108,8 @@ class SIMDInfoVariation:
         This functions analyses a list of SIMDInfo objects (different years, the same postcode) and computes the changes
         :return A pd.DataFrame object representing the changes
         """
+        import pandas as pd
+
         # No need to calculate the changes in version, data_zone_id and data_zone_name
         not_interested_fields = {"version", "data_zone_id", "data_zone_name"}
         # Initialise a pd.DataFrame object
@@ -120,6 +129,133 @@ class SIMDInfoVariation:
                 tt = 1
 
 
+READ_RESULTS_SCRIPT = """
+const text = (element) => element === null ? "" : element.innerText;
+const components = [];
+for (const row of document.querySelectorAll("#componenttable > tbody > tr")) {
+    components.push({
+        caption: text(row.querySelector(".componentcaption")),
+        bar: text(row.querySelector(".componentcaption + div"))
+    });
+}
+return {
+    data_zone_id: text(document.getElementById("datazoneid")),
+    data_zone_name: text(document.getElementById("igname")),
+    components: components
+};
+"""  # JavaScript returning everything __read_results needs as one JSON object
+
+# Keyword in the domain name -> prefix of the corresponding SIMDInfo fields
+DOMAIN_FIELDS = (
+    ("overall", "overall"),
+    ("income", "income"),
+    ("employment", "employment"),
+    ("health", "health"),
+    ("education", "edu"),
+    ("housing", "housing"),
+    ("geographic", "geo_access"),
+    ("crime", "crime"),
+)
+
+
+def domain_rank_fields(domain_name: str, domain_rank: int, rank_bar: int) -> dict:
+    """
+    Map the rank and bar of a domain to the keyword arguments of SIMDInfo
+    :param domain_name: Name of the domain as shown by simd.scot, e.g., "Income domain"
+    :param domain_rank: The number of rank
+    :param rank_bar: The bar indicator of rank
+    :return A dict such as {"income_rank": 6530, "income_rank_bar": 10}
+    """
+    domain_name = domain_name.strip().lower()
+    for keyword, field in DOMAIN_FIELDS:
+        if keyword in domain_name:
+            return {f"{field}_rank": domain_rank, f"{field}_rank_bar": rank_bar}
+
+    raise RuntimeError(f"Unknown domain_name={domain_name}")
+
+
+def parse_simd_results(results: dict, *, postcode: str, version: int) -> SIMDInfo:
+    """
+    Parse the JSON object returned by READ_RESULTS_SCRIPT
+    :param results: Dict with "data_zone_id", "data_zone_name" and "components", where each component has a
+    "caption" such as "Overall: 6843" and a "bar" such as "10"
+    :param postcode: Post code of the research
+    :param version: Year of the database
+    :return A SIMDInfo object
+    """
+    # As find_element did, fail (so that clear_and_search retries) if the result panel has not been rendered yet
+    if not results["data_zone_id"].strip():
+        raise RuntimeError(f"No data zone in the results for postcode={postcode}")
+    if results["components"].__len__() == 0:
+        raise RuntimeError(f"No domain in the results for postcode={postcode}")
+
+    ranks = {}
+    for component in results["components"]:
+        component_caption = component["caption"].split(":")
+        domain_name = component_caption[0]
+        domain_rank = int(float(component_caption[1]))
+        rank_bar = int(component["bar"].strip())
+        ranks.update(domain_rank_fields(domain_name, domain_rank, rank_bar))
+
+    simd_info = SIMDInfo(
+        data_zone_id=results["data_zone_id"].strip().lower(),
+        data_zone_name=results["data_zone_name"].strip().lower(),
+        postcode=postcode,
+        version=version,
+        **ranks
+    )
+
+    return simd_info
+
+
+LEAN_BLOCKED_URLS = (
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp",  # images and raster map tiles
+    "*.woff", "*.woff2", "*.ttf", "*.otf",  # fonts
+)  # URL patterns blocked through CDP by the lean profile of SIMDCrawler
+# The click-to-select is made at the center of the window, where the map centres the searched postcode, so a smaller
+# window is enough. Not measured against the live site yet: pass initial_window_size if the click misses
+LEAN_WINDOW_SIZE = (1024, 768)
+
+
+def build_edge_options(use_headless: bool, lean: bool):
+    """
+    Build the options of the Chromium based Edge
+    :param use_headless: Whether to use headless mode
+    :param lean: Whether to use the lightweight profile, see SIMDCrawler
+    :return An msedge.selenium_tools.EdgeOptions object
+    """
+    from msedge.selenium_tools import EdgeOptions
+    options = EdgeOptions()
+    options.use_chromium = True
+    if use_headless:
+        options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+    if lean:
+        # EdgeOptions.page_load_strategy is dropped from the capabilities when use_chromium is set
+        options.set_capability("pageLoadStrategy", "eager")
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+    return options
+
+
+def block_lean_urls(browser: WebDriver) -> None:
+    """
+    Block LEAN_BLOCKED_URLS through CDP. Works with msedge.selenium_tools.Edge, and with a RemoteWebDriver connected to
+    msedgedriver (which has no execute_cdp_cmd)
+    :param browser: The WebDriver object
+    """
+    if hasattr(browser, "execute_cdp_cmd"):
+        execute_cdp_cmd = browser.execute_cdp_cmd
+    else:
+        browser.command_executor._commands["executeCdpCommand"] = ("POST", "/session/$sessionId/ms/cdp/execute")
+
+        def execute_cdp_cmd(cmd: str, params: dict) -> dict:
+            return browser.execute("executeCdpCommand", {"cmd": cmd, "params": params})["value"]
+
+    execute_cdp_cmd("Network.enable", {})
+    execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(LEAN_BLOCKED_URLS)})
+
+
 class SIMDCrawler:
     """
     A class used to send request and parse its results from simd.scot
@@ -129,40 +265,59 @@ class SIMDCrawler:
                  executable_path: str = None,
                  browser_name: str = "edge",
                  use_headless: bool = True,
-                 initial_window_size: Tuple[int, int] = (1920, 1080), *,
-                 version: int):
+                 initial_window_size: Tuple[int, int] = None, *,
+                 version: int,
+                 lean: bool = False,
+                 browser: WebDriver = None):
         """
         Constructor
         :param executable_path: Path to the executable
         :param browser_name: Name of the browser, currently only supports "edge"
         :param use_headless: Whether to use headless mode
-        :param initial_window_size: The initial size of browser window to be set
+        :param initial_window_size: The initial size of browser window to be set. Defaults to (1920, 1080), or
+        LEAN_WINDOW_SIZE if lean
         :param version: Representing year of the database
+        :param lean: Whether to use a lightweight profile, i.e., "eager" page load strategy and no images, map tiles
+        or fonts. The data zone layer is still loaded so that click-to-select works
+        :param browser: A running WebDriver session to attach to instead of launching a browser, e.g., from
+        browser_daemon.attach. Its profile is set by whoever started it, and close() does not quit it
         """
         assert browser_name in {"edge", "chrome"}
         executable_path = executable_path or rf"C:\Users\{getpass.getuser()}\EdgeWebDriver\msedgedriver.exe"
+        self.__owns_browser = browser is None  # type: bool
 
-        if browser_name == "edge":
-            if use_headless:
+        if browser is not None:
+            self.browser = browser
+        elif browser_name == "edge":
+            if use_headless or lean:
                 from msedge.selenium_tools import Edge
-                from msedge.selenium_tools import EdgeOptions
-                options = EdgeOptions()
-                options.use_chromium = True
-                options.add_argument('--headless')
-                options.add_argument('--disable-gpu')
 
-                self.browser = Edge(executable_path=executable_path, options=options)
+                self.browser = Edge(executable_path=executable_path, options=build_edge_options(use_headless, lean))
+                if lean:
+                    # Images are disabled by prefs, but tiles and fonts can only be blocked by URL
+                    block_lean_urls(self.browser)
             else:
+                from selenium import webdriver
                 self.browser = webdriver.Edge(executable_path=executable_path)
         else:
             raise NotImplementedError(f"Not implemented for {browser_name}")
 
+        if initial_window_size is None:
+            initial_window_size = LEAN_WINDOW_SIZE if lean else (1920, 1080)
         self.initial_window_size = initial_window_size  # type: Tuple[int, int]
         self.version = version  # type: int
+        self.lean = lean  # type: bool
 
     def __repr__(self) -> str:
         return f"Year={self.version} SIMD crawler"
 
+    def close(self) -> None:
+        """
+        Quit the browser, unless it is an attached session which outlives this object
+        """
+        if self.__owns_browser:
+            self.browser.quit()
+
     def update_version(self, version: int) -> None:
         """
         Setter for version field
@@ -182,6 +337,10 @@ class SIMDCrawler:
         """
         Click the "Clear selected data" button
         """
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait as WAIT
+
         wait_driver = WAIT(self.browser, 10)
         button = wait_driver.until(EC.presence_of_element_located((By.ID, "clearSelectedDataButton")))
         if "disabled" not in button.get_attribute("class"):
@@ -192,8 +351,7 @@ class SIMDCrawler:
         Get the page content size, not the window size
         :return: Inner size
         """
-        inner_width = self.browser.execute_script("return window.innerWidth")
-        inner_height = self.browser.execute_script("return window.innerHeight")
+        inner_width, inner_height = self.browser.execute_script("return [window.innerWidth, window.innerHeight]")
 
         return inner_width, inner_height
 
@@ -202,8 +360,10 @@ class SIMDCrawler:
         Move mouse to center then click
         :return ActionChains object that can execute
         """
-        action = ActionChains(self.browser).move_by_offset(self.__get_inner_size()[0] // 2,
-                                                           self.__get_inner_size()[1] // 2).click()
+        from selenium.webdriver.common.action_chains import ActionChains
+
+        inner_width, inner_height = self.__get_inner_size()
+        action = ActionChains(self.browser).move_by_offset(inner_width // 2, inner_height // 2).click()
 
         return action
 
@@ -213,6 +373,8 @@ class SIMDCrawler:
         (Supposing no window size change or mouse movement after calling __move_mouse_from_origin_to_center)
         :return ActionChains object that can execute
         """
+        from selenium.webdriver.common.action_chains import ActionChains
+
         action = ActionChains(self.browser).move_to_location(0, 0)
 
         return action
@@ -222,6 +384,10 @@ class SIMDCrawler:
         Fill the post code, then click the "Go" button
         :param postcode: Post code of the research
         """
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait as WAIT
+
         wait_driver = WAIT(self.browser, 10)
         # Fill the postcode
         postcode_box = wait_driver.until(EC.presence_of_element_located((By.ID, "postcode")))
@@ -238,91 +404,14 @@ class SIMDCrawler:
 
     def __read_results(self, postcode: str) -> SIMDInfo:
         """
-        Read the results from the current window
+        Read the results from the current window.
+        All the fields are collected by a single script so that only one WebDriver round trip is needed
         :param postcode: Post code of the research
         :return A search result representing by a SIMDInfo object
         """
-        # wait_driver = WAIT(self.browser, 10)
-        # data_zone_id = wait_driver.until(EC.visibility_of_element_located())
-        data_zone_id = self.browser.find_element(By.ID, "datazoneid").text.strip().lower()
-
-        # data_zone_name = wait_driver.until(EC.visibility_of_element_located((By.ID, "igname")))
-        data_zone_name = self.browser.find_element(By.ID, "igname").text.strip().lower()
-
-        overall_rank = -1
-        overall_rank_bar = -1
-        income_rank = -1
-        income_rank_bar = -1
-        employment_rank = -1
-        employment_rank_bar = -1
-        health_rank = -1
-        health_rank_bar = -1
-        edu_rank = -1
-        edu_rank_bar = -1
-        housing_rank = -1
-        housing_rank_bar = -1
-        geo_access_rank = -1
-        geo_access_rank_bar = -1
-        crime_rank = -1
-        crime_rank_bar = -1
-
-        for element in self.browser.find_elements(By.CSS_SELECTOR, "#componenttable > tbody > tr"):
-            component_caption = element.find_element(By.CSS_SELECTOR, ".componentcaption").text.split(":")
-            domain_name = component_caption[0].strip().lower()
-            domain_rank = int(float(component_caption[1]))
-            rank_bar = int(element.find_element(By.CSS_SELECTOR, ".componentcaption + div").text.strip())
-
-            if "overall" in domain_name:
-                overall_rank = domain_rank
-                overall_rank_bar = rank_bar
-            elif "income" in domain_name:
-                income_rank = domain_rank
-                income_rank_bar = rank_bar
-            elif "employment" in domain_name:
-                employment_rank = domain_rank
-                employment_rank_bar = rank_bar
-            elif "health" in domain_name:
-                health_rank = domain_rank
-                health_rank_bar = rank_bar
-            elif "education" in domain_name:
-                edu_rank = domain_rank
-                edu_rank_bar = rank_bar
-            elif "housing" in domain_name:
-                housing_rank = domain_rank
-                housing_rank_bar = rank_bar
-            elif "geographic" in domain_name:
-                geo_access_rank = domain_rank
-                geo_access_rank_bar = rank_bar
-            elif "crime" in domain_name:
-                crime_rank = domain_rank
-                crime_rank_bar = rank_bar
-            else:
-                raise RuntimeError(f"Unknown domain_name={domain_name}")
+        results = self.browser.execute_script(READ_RESULTS_SCRIPT)
 
-        simd_info = SIMDInfo(
-            data_zone_id=data_zone_id,
-            data_zone_name=data_zone_name,
-            postcode=postcode,
-            overall_rank=overall_rank,
-            overall_rank_bar=overall_rank_bar,
-            income_rank=income_rank,
-            income_rank_bar=income_rank_bar,
-            employment_rank=employment_rank,
-            employment_rank_bar=employment_rank_bar,
-            health_rank=health_rank,
-            health_rank_bar=health_rank_bar,
-            edu_rank=edu_rank,
-            edu_rank_bar=edu_rank_bar,
-            housing_rank=housing_rank,
-            housing_rank_bar=housing_rank_bar,
-            geo_access_rank=geo_access_rank,
-            geo_access_rank_bar=geo_access_rank_bar,
-            crime_rank=crime_rank,
-            crime_rank_bar=crime_rank_bar,
-            version=self.version
-        )
-
-        return simd_info
+        return parse_simd_results(results, postcode=postcode, version=self.version)
 
     def clear_and_search(self, postcode: str, retry=1) -> SIMDInfo:
         """
@@ -348,3 +437,143 @@ class SIMDCrawler:
                 raise Exception("Maximum retry encounter in clear_and_search")
 
             return self.clear_and_search(postcode, retry + 1)
+
+
+class SIMDHTTPCrawler:
+    """
+    A class used to query simd.scot through the data requests issued by its front end, i.e., without a browser.
+    It has the same update_version/clear_and_search(postcode) interface as SIMDCrawler, which can be given as a
+    fallback
+    """
+
+    # ASSUMED layout of the data requests of the front end of simd.scot, NOT yet checked against the live site.
+    # The postcode lookup is assumed to return {"datazoneid": ...}, and the data zone request
+    # {"datazoneid": ..., "igname": ..., "domains": [...]} where each domain is
+    # {"name": "Income domain", "rank": 6530.5, "bar": 10}. Adjust the templates and search() to the real XHR
+    # traffic before relying on this class. Until then it is not offered by main.py or distributed.py, as against the
+    # live site every search would fail and fall back to the browser, i.e., be slower than the browser alone
+    POSTCODE_URL_TEMPLATE = "{base_url}/api/simd{version}/postcode/{postcode}"
+    DATA_ZONE_URL_TEMPLATE = "{base_url}/api/simd{version}/datazone/{data_zone_id}"
+
+    def __init__(self,
+                 base_url: str = "https://simd.scot",
+                 pool_size: int = 16,
+                 timeout: float = 10, *,
+                 version: int,
+                 fallback: SIMDCrawler = None):
+        """
+        Constructor
+        :param base_url: Scheme and host of the data requests. Can point to a local stand-in for testing
+        :param pool_size: Maximum number of pooled connections, which is also the default concurrency of search_many
+        :param timeout: Timeout in seconds of each request
+        :param version: Representing year of the database
+        :param fallback: A SIMDCrawler used when the data requests fail
+        """
+        self.base_url = base_url.rstrip("/")  # type: str
+        self.pool_size = pool_size  # type: int
+        self.timeout = timeout  # type: float
+        self.version = version  # type: int
+        self.fallback = fallback  # type: SIMDCrawler
+        # The browser can only serve one search at a time
+        self.__fallback_lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __repr__(self) -> str:
+        return f"Year={self.version} SIMD HTTP crawler"
+
+    def close(self) -> None:
+        """
+        Close the pooled session, and the fallback SIMDCrawler if any
+        """
+        self.session.close()
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def update_version(self, version: int) -> None:
+        """
+        Setter for version field
+        :param version: Representing year of the database
+        """
+        self.version = version
+
+    def __get_json(self, url: str) -> dict:
+        """
+        Send a GET request and decode its JSON body
+        :param url: url of the data request
+        :return The decoded JSON
+        """
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise requests.RequestException(f"Encounter status_code={response.status_code} for url={url}")
+
+        return response.json()
+
+    def search(self, postcode: str, *, version: int = None) -> SIMDInfo:
+        """
+        Search by postcode through the data requests only
+        :param postcode: Post code of the research
+        :param version: Representing year of the database, defaults to self.version
+        :return: A SIMDInfo at the location of postcode
+        """
+        version = version or self.version
+        postcode_json = self.__get_json(self.POSTCODE_URL_TEMPLATE.format(
+            base_url=self.base_url,
+            version=version,
+            postcode=requests.utils.quote(postcode.strip().upper())
+        ))
+        data_zone_json = self.__get_json(self.DATA_ZONE_URL_TEMPLATE.format(
+            base_url=self.base_url,
+            version=version,
+            data_zone_id=postcode_json["datazoneid"]
+        ))
+
+        ranks = {}
+        for domain in data_zone_json["domains"]:
+            ranks.update(domain_rank_fields(domain["name"], int(float(domain["rank"])), int(domain["bar"])))
+
+        simd_info = SIMDInfo(
+            data_zone_id=data_zone_json["datazoneid"].strip().lower(),
+            data_zone_name=data_zone_json["igname"].strip().lower(),
+            postcode=postcode,
+            version=version,
+            **ranks
+        )
+
+        return simd_info
+
+    def clear_and_search(self, postcode: str, *, version: int = None) -> SIMDInfo:
+        """
+        Search by postcode, using the fallback SIMDCrawler (if any) when the data requests fail
+        :param postcode: Post code of the research
+        :param version: Representing year of the database, defaults to self.version
+        :return: A SIMDInfo at the location of postcode
+        """
+        version = version or self.version
+        try:
+            return self.search(postcode, version=version)
+        except (requests.RequestException, ValueError, KeyError, RuntimeError) as e:
+            if self.fallback is None:
+                raise
+
+            print(f"Data requests failed for postcode={postcode}: {e}. Falling back to the browser")
+            with self.__fallback_lock:
+                self.fallback.update_version(version)
+                return self.fallback.clear_and_search(postcode)
+
+    def search_many(self, postcodes: Iterable[str], version: int = None, max_workers: int = None) -> List[SIMDInfo]:
+        """
+        Search many postcodes concurrently over the pooled session
+        :param postcodes: Post codes of the research
+        :param version: Representing year of the database, defaults to self.version
+        :param max_workers: Number of concurrent requests, defaults to pool_size
+        :return: SIMDInfo objects in the same order as postcodes
+        """
+        version = version or self.version
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            return list(executor.map(lambda postcode: self.clear_and_search(postcode, version=version),
+                                     postcodes))
@@ -0,0 +1,152 @@
+"""
+A long-lived local browser service, so that SIMDCrawler does not pay the start-up of Edge/msedgedriver in every
+process. Start it once with
+
+    python browser_daemon.py --sessions 2 --lean
+
+which runs msedgedriver as a WebDriver server, opens pre-warmed sessions on simd.scot and writes them to a state file.
+Other processes then use attach(version=2020, session_index=0) to get a SIMDCrawler on one of the sessions.
+A session serves one client at a time: give each concurrent process its own session_index
+"""
+from __future__ import annotations
+
+import argparse
+import getpass
+import json
+import subprocess
+import time
+from typing import TYPE_CHECKING
+
+import requests
+
+from SIMD import SIMDCrawler, build_edge_options, block_lean_urls, LEAN_WINDOW_SIZE
+
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+DEFAULT_STATE_PATH = "./browser_daemon.json"
+DRIVER_START_TIMEOUT = 30  # In seconds
+
+
+def attach_to_session(command_executor: str, session_id: str, w3c: bool = True) -> WebDriver:
+    """
+    Connect to a running WebDriver session instead of creating one
+    :param command_executor: url of the WebDriver server, e.g., http://127.0.0.1:9515
+    :param session_id: id of the session
+    :param w3c: Whether the session speaks the W3C protocol
+    :return A RemoteWebDriver object on the session
+    """
+    from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+    class AttachedRemoteWebDriver(RemoteWebDriver):
+        def start_session(self, capabilities, browser_profile=None) -> None:
+            # Called by the constructor, which would otherwise create a new session
+            self.session_id = session_id
+            self.capabilities = {}
+            self.w3c = w3c
+
+    return AttachedRemoteWebDriver(command_executor=command_executor, desired_capabilities={})
+
+
+def attach(*, version: int, session_index: int = 0, state_path: str = DEFAULT_STATE_PATH) -> SIMDCrawler:
+    """
+    Get a SIMDCrawler on a session of the running daemon
+    :param version: Representing year of the database
+    :param session_index: Which of the pre-warmed sessions to use
+    :param state_path: Path to the state file written by the daemon
+    :return A SIMDCrawler object, whose close() leaves the session running
+    """
+    with open(state_path) as f:
+        state = json.load(f)
+    session = state["sessions"][session_index]
+    browser = attach_to_session(state["command_executor"], session["session_id"], session["w3c"])
+    initial_window_size = LEAN_WINDOW_SIZE if state["lean"] else None
+
+    return SIMDCrawler(initial_window_size=initial_window_size, version=version, lean=state["lean"], browser=browser)
+
+
+def wait_for_driver(command_executor: str, driver_process: subprocess.Popen,
+                    timeout: float = DRIVER_START_TIMEOUT, interval: float = 0.1) -> None:
+    """
+    Wait until the WebDriver server answers GET /status, i.e., it listens and accepts new sessions
+    :param command_executor: url of the WebDriver server, e.g., http://127.0.0.1:9515
+    :param driver_process: The process of the WebDriver server
+    :param timeout: Maximum time to wait, in seconds
+    :param interval: Time between polls, in seconds
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if driver_process.poll() is not None:
+            raise RuntimeError(f"msedgedriver exited with code={driver_process.returncode} before it was ready")
+        try:
+            response = requests.get(f"{command_executor}/status", timeout=interval * 10)
+            if response.ok and response.json()["value"].get("ready", True):
+                return
+        except (requests.RequestException, ValueError, KeyError, AttributeError):
+            pass  # Not listening yet
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"msedgedriver at {command_executor} is not ready after {timeout} seconds")
+        time.sleep(interval)
+
+
+def serve(executable_path: str = None,
+          port: int = 9515,
+          session_num: int = 1,
+          use_headless: bool = True,
+          lean: bool = False,
+          state_path: str = DEFAULT_STATE_PATH) -> None:
+    """
+    Run msedgedriver with pre-warmed sessions on simd.scot until interrupted
+    :param executable_path: Path to msedgedriver
+    :param port: Port of the WebDriver server
+    :param session_num: Number of sessions
+    :param use_headless: Whether to use headless mode
+    :param lean: Whether to use the lightweight profile, see SIMDCrawler
+    :param state_path: Path to the state file read by attach
+    """
+    from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+    executable_path = executable_path or rf"C:\Users\{getpass.getuser()}\EdgeWebDriver\msedgedriver.exe"
+    command_executor = f"http://127.0.0.1:{port}"
+    driver_process = subprocess.Popen([executable_path, f"--port={port}"])
+    browsers = []
+    try:
+        wait_for_driver(command_executor, driver_process)
+        for _ in range(session_num):
+            capabilities = build_edge_options(use_headless, lean).to_capabilities()
+            browser = RemoteWebDriver(command_executor=command_executor, desired_capabilities=capabilities)
+            if lean:
+                block_lean_urls(browser)
+            # Pre-warm, so that the page and its scripts are in the cache of the session
+            browser.get("https://simd.scot/#/simd2020/BTTTFTT/14/-3.2023/55.9450/")
+            browsers.append(browser)
+
+        with open(state_path, "w") as f:
+            json.dump({
+                "command_executor": command_executor,
+                "lean": lean,
+                "sessions": [{"session_id": browser.session_id, "w3c": browser.w3c} for browser in browsers]
+            }, f)
+        print(f"Serving {session_num} sessions at {command_executor}, state written to {state_path}")
+
+        while driver_process.poll() is None:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for browser in browsers:
+            browser.quit()
+        driver_process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pre-warmed browser sessions for SIMDCrawler")
+    parser.add_argument("--executable-path", default=None, help="Path to msedgedriver")
+    parser.add_argument("--port", type=int, default=9515)
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--show", action="store_true", help="Do not use headless mode")
+    parser.add_argument("--lean", action="store_true",
+                        help="Use the lightweight browser profile, without images, map tiles or fonts")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="Path to the state file read by attach")
+    args = parser.parse_args()
+    serve(args.executable_path, args.port, args.sessions, not args.show, args.lean, args.state)
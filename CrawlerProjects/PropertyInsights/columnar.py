@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import datetime
+import os
+from pipeline import EnrichedPropertyInfo
+from typing import Dict, Iterable, List, Tuple, TYPE_CHECKING
+
+# pyarrow is an optional dependency, only needed for the Parquet output
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Column name -> logical type. "category" is dictionary encoded
+PROPERTY_COLUMN_TYPES = {
+    "price_type": "category",
+    "price_val": "int32",
+    "title": "string",
+    "address": "string",
+    "postcode": "string",
+    "bed_num": "int8",
+    "bath_num": "int8",
+    "couch_num": "int8",
+    "floor_area": "int32",
+    "council_tax": "category",
+    "epc": "category",
+    "url": "string",
+}
+SIMD_DOMAINS = ("overall", "income", "employment", "health", "edu", "housing", "geo_access", "crime")
+
+
+def simd_column_types(version: int) -> Dict[str, str]:
+    """
+    :param version: Year of the SIMD database
+    :return Column name -> logical type of the SIMD columns of a version, named as by EnrichedPropertyInfo.to_row
+    """
+    column_types = {f"simd_{version}_data_zone_id": "category", f"simd_{version}_data_zone_name": "category"}
+    for domain in SIMD_DOMAINS:
+        column_types[f"simd_{version}_{domain}_rank"] = "int32"
+        column_types[f"simd_{version}_{domain}_rank_bar"] = "int8"
+
+    return column_types
+
+
+def import_pyarrow():
+    """
+    :return The pyarrow module, with its parquet submodule imported
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The Parquet output requires pyarrow, install it with: pip install pyarrow")
+
+    return pyarrow
+
+
+def arrow_schema(versions: Tuple[int, ...] = (2020, 2016, 2012)) -> pa.Schema:
+    """
+    :param versions: Years of the SIMD database
+    :return The Arrow schema of the enriched properties (without the partition columns)
+    """
+    pa = import_pyarrow()
+    arrow_types = {
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "string": pa.string(),
+        "int32": pa.int32(),
+        "int8": pa.int8(),
+    }
+    column_types = dict(PROPERTY_COLUMN_TYPES)
+    for version in versions:
+        column_types.update(simd_column_types(version))
+
+    return pa.schema([(column, arrow_types[column_type]) for column, column_type in column_types.items()])
+
+
+def search_label(search: dict) -> str:
+    """
+    A value of the search partition which is safe as a directory name
+    :param search: Keyword arguments of ESPCCrawler
+    :return e.g., "edinburgh_1plus_210000_flat+house"
+    """
+    return "_".join(str(search[key]).replace(",", "+").replace("/", "-")
+                    for key in ("location", "min_beds", "max_price", "property_type"))
+
+
+def write_parquet(records: Iterable[EnrichedPropertyInfo],
+                  root: str,
+                  search: dict,
+                  crawl_date: datetime.date = None,
+                  versions: Tuple[int, ...] = (2020, 2016, 2012),
+                  batch_size: int = 10000) -> str:
+    """
+    Write the enriched properties of a crawl as typed Parquet, in the file
+    root/crawl_date=YYYY-MM-DD/search=<search_label>/part-0.parquet. The records are written by batches, so they can be
+    a stream. The file of the partition is replaced as a whole, so writing a crawl again (e.g., when it is resumed)
+    does not duplicate its rows, and an interrupted write leaves the previous file in place
+    :param records: EnrichedPropertyInfo objects, e.g., from iter_enriched
+    :param root: Root directory of the dataset
+    :param search: Keyword arguments of ESPCCrawler of the crawl
+    :param crawl_date: Date of the crawl, defaults to today
+    :param versions: Years of the SIMD database of the records
+    :param batch_size: Number of rows per row group
+    :return Path to the written file
+    """
+    pa = import_pyarrow()
+    schema = arrow_schema(versions)
+    crawl_date = crawl_date or datetime.date.today()
+    directory = os.path.join(root, f"crawl_date={crawl_date.isoformat()}", f"search={search_label(search)}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part-0.parquet")
+    # Starting with ".", so that it is ignored by read_parquet until renamed
+    temp_path = os.path.join(directory, f".part-0.parquet.{os.getpid()}.tmp")
+
+    def to_batch(rows: List[dict]) -> pa.RecordBatch:
+        return pa.RecordBatch.from_arrays(
+            [pa.array([row[field.name] for row in rows], type=field.type) for field in schema],
+            schema=schema
+        )
+
+    try:
+        with pa.parquet.ParquetWriter(temp_path, schema) as writer:
+            rows = []
+            for record in records:
+                rows.append(record.to_row())
+                if rows.__len__() >= batch_size:
+                    writer.write_batch(to_batch(rows))
+                    rows = []
+            if rows:
+                writer.write_batch(to_batch(rows))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return path
+
+
+def read_parquet(root: str, columns: List[str] = None, filters: list = None) -> pa.Table:
+    """
+    Read the dataset written by write_parquet, all crawls and searches at once. Only the columns asked for are read,
+    and the files are memory mapped
+    :param root: Root directory of the dataset
+    :param columns: Columns to read, defaults to all. "crawl_date" and "search" are the partition columns
+    :param filters: Row filters in the format of pyarrow.parquet.read_table,
+    e.g., [("crawl_date", ">=", "2026-01-01"), ("price_val", "<", 200000)]
+    :return A pyarrow.Table object
+    """
+    pa = import_pyarrow()
+    import pyarrow.dataset
+
+    # ISO dates as strings compare in date order, and are the same whatever the inference of pyarrow
+    partitioning = pa.dataset.partitioning(pa.schema([("crawl_date", pa.string()), ("search", pa.string())]),
+                                           flavor="hive")
+
+    return pa.parquet.read_table(root, columns=columns, filters=filters, memory_map=True, partitioning=partitioning)
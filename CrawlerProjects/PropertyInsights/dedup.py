@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import re
+from ESPC import ESPCPropertyInfo, canonical_property_url
+from typing import Dict, List, Optional, Tuple
+
+POSTCODE_PATTERN = re.compile(r"\b(eh\d+)[\s-]*(\d[a-z]{2})\b")
+# Words written differently by different agents
+ABBREVIATIONS = {
+    "rd": "road",
+    "st": "street",
+    "pl": "place",
+    "ave": "avenue",
+    "av": "avenue",
+    "cres": "crescent",
+    "ter": "terrace",
+    "terr": "terrace",
+    "gdns": "gardens",
+    "sq": "square",
+    "ct": "court",
+    "dr": "drive",
+    "ln": "lane",
+}
+IGNORED_WORDS = {"flat", "the"}
+
+
+def normalise_postcode(text: str) -> str:
+    """
+    :param text: Text containing a postcode, e.g., "EH11 2EJ", "eh112ej" or the slug "...-eh11-2ej"
+    :return The postcode, e.g., "eh11 2ej", or "" if not found
+    """
+    found = POSTCODE_PATTERN.findall(text.lower())
+    if found.__len__() == 0:
+        return ""
+
+    return " ".join(found[-1])
+
+
+def address_words(address: str) -> Tuple[str, ...]:
+    """
+    :param address: Address of a property, e.g., "Flat 3/4, 15 Downfield Pl., Edinburgh, EH11 2EJ", or the slug of its
+    url, e.g., "15-3f4-downfield-place-edinburgh-eh11-2ej"
+    :return Its words in order, without postcode and punctuation, e.g., ("3f4", "15", "downfield", "place", "edinburgh")
+    """
+    address = POSTCODE_PATTERN.sub(" ", address.lower())
+    # The flat position, "3/4" or "3f4", i.e., 3rd floor, 4th door
+    address = re.sub(r"\b(\d+)\s*/\s*(\d+)\b", r"\1f\2", address)
+    words = [ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", address)]
+
+    return tuple(word for word in words if word not in IGNORED_WORDS)
+
+
+def normalise_address(address: str) -> Tuple[str, ...]:
+    """
+    :param address: Address of a property, see address_words
+    :return Its words, sorted as agents do not order them the same way, e.g.,
+    ("15", "3f4", "downfield", "edinburgh", "place")
+    """
+    return tuple(sorted(address_words(address)))
+
+
+def slug_of_url(url: str) -> str:
+    """
+    :param url: url of the property, e.g., https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521
+    :return The address part of the url, e.g., "15-3f4-downfield-place-edinburgh-eh11-2ej", or "" if not found
+    """
+    found = re.findall(r"/property/([^/]+)/\d+/?$", canonical_property_url(url))
+    if found.__len__() == 0:
+        return ""
+
+    return found[0]
+
+
+def fingerprint(property_info: ESPCPropertyInfo) -> str:
+    """
+    :param property_info: The ESPCPropertyInfo object
+    :return A hash of its normalised address and postcode, floor area and bed/bath numbers, the same for the listings
+    of the same property whatever their url, agent or price
+    """
+    key = "|".join([
+        normalise_postcode(property_info.postcode),
+        " ".join(normalise_address(property_info.address)),
+        str(property_info.floor_area),
+        str(property_info.bed_num),
+        str(property_info.bath_num),
+    ])
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def similar_addresses(words_a: Tuple[str, ...], words_b: Tuple[str, ...], threshold: float = 0.85) -> bool:
+    """
+    Whether two normalised addresses (see normalise_address) are the same but for small differences, e.g., a typo or
+    a missing town. Their numbers must be the same, so that neighbouring flats are not taken for each other
+    :param words_a: Words of an address
+    :param words_b: Words of the other address
+    :param threshold: Minimum similarity, from 0 to 1
+    :return A boolean
+    """
+    numbers_a = {word for word in words_a if re.search(r"\d", word)}
+    numbers_b = {word for word in words_b if re.search(r"\d", word)}
+    if numbers_a != numbers_b:
+        return False
+    if set(words_a) <= set(words_b) or set(words_b) <= set(words_a):
+        return True
+
+    return difflib.SequenceMatcher(None, " ".join(words_a), " ".join(words_b)).ratio() >= threshold
+
+
+class DuplicateDetector:
+    """
+    Detect the listings of a property already seen under another url, e.g., relisted or listed by a second agent.
+    Candidates are only compared to the listings of the same postcode
+    """
+
+    def __init__(self, threshold: float = 0.85):
+        """
+        Constructor
+        :param threshold: Minimum similarity of addresses, see similar_addresses
+        """
+        self.threshold = threshold  # type: float
+        self.fingerprints = {}  # type: Dict[str, str]
+        # Postcode -> (address words, (floor area, bed number, bath number), url) of the listings added
+        self.listings = {}  # type: Dict[str, List[Tuple[Tuple[str, ...], Tuple[int, int, int], str]]]
+        # Postcode -> (words of the slug in order, url) of the listings added
+        self.slugs = {}  # type: Dict[str, List[Tuple[Tuple[str, ...], str]]]
+
+    def __repr__(self) -> str:
+        return f"Duplicate detector of {self.fingerprints.__len__()} properties"
+
+    def __len__(self) -> int:
+        return self.fingerprints.__len__()
+
+    def find_url(self, url: str) -> Optional[str]:
+        """
+        Find the property of a url from its slug only, i.e., before fetching its details. Only the same slug (but for
+        abbreviations and punctuation) is matched: the slug does not tell apart the units of a building (e.g.,
+        "two-bed-..." and "three-bed-...") as the details do, nor flat 1/12 from flat 12/1 once sorted, so similar
+        slugs are left to add. Slugs without a number (e.g., a street without house or flat number) are not matched,
+        as they may be different properties
+        :param url: url of the property
+        :return url of the property added before, or None if not found
+        """
+        slug = slug_of_url(url)
+        postcode = normalise_postcode(slug)
+        words = address_words(slug)
+        if not postcode or not any(re.search(r"\d", word) for word in words):
+            return None
+
+        for known_words, known_url in self.slugs.get(postcode, []):
+            if known_url != canonical_property_url(url) and words == known_words:
+                return known_url
+
+        return None
+
+    def add(self, property_info: ESPCPropertyInfo) -> Optional[str]:
+        """
+        Add a property, unless it has been added before under another url
+        :param property_info: The ESPCPropertyInfo object
+        :return url of the property added before, or None if the property is new (and then added)
+        """
+        url = canonical_property_url(property_info.url)
+        key = fingerprint(property_info)
+        if key in self.fingerprints:
+            return self.fingerprints[key] if self.fingerprints[key] != url else None
+
+        postcode = normalise_postcode(property_info.postcode)
+        words = normalise_address(property_info.address)
+        details = (property_info.floor_area, property_info.bed_num, property_info.bath_num)
+        if postcode and words:
+            for known_words, known_details, known_url in self.listings.get(postcode, []):
+                if known_url != url and known_details == details and \
+                        similar_addresses(words, known_words, self.threshold):
+                    return known_url
+
+        self.fingerprints[key] = url
+        if postcode:
+            self.listings.setdefault(postcode, []).append((words, details, url))
+        slug = slug_of_url(url)
+        if normalise_postcode(slug):
+            self.slugs.setdefault(normalise_postcode(slug), []).append((address_words(slug), url))
+
+        return None
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from ESPC import ESPCCrawler, ESPCPropertyInfo, canonical_property_url
+from SIMD import SIMDCrawler, SIMDInfo
+from main import DEFAULT_SEARCH, SIMD_VERSIONS, build_simd_crawler, form_dataframe_and_save_all
+from work_queue import WorkQueue, Shard
+from typing import Callable, List, Tuple
+import argparse
+import json
+import os
+import socket
+import time
+
+
+def search_key(search: dict) -> str:
+    """
+    A unique and readable key of the search parameters
+    :param search: Keyword arguments of ESPCCrawler, e.g., DEFAULT_SEARCH
+    :return The key
+    """
+    return "&".join(f"{key}={search[key]}" for key in sorted(search))
+
+
+def put_pages_shard(queue: WorkQueue, search: dict, start: int, end: int, last: bool) -> bool:
+    """
+    Add a shard of listing pages [start, end] of a search
+    :param queue: The work queue
+    :param search: Keyword arguments of ESPCCrawler
+    :param start: First page
+    :param end: Last page
+    :param last: Whether it is the last planned shard of the search, which extends the plan if all its pages are valid
+    :return Whether the shard is added
+    """
+    payload = {"search": search, "start": start, "end": end, "last": last}
+
+    return queue.put("pages", payload, key=f"pages:{search_key(search)}:{start}-{end}")
+
+
+def enqueue_searches(queue: WorkQueue, searches: List[dict], max_pages: int = 20, pages_per_shard: int = 2) -> None:
+    """
+    The coordinator, which splits the searches into shards of listing pages.
+    The number of pages of a search is unknown beforehand: the shards beyond the last page cost one listing request
+    each, and the plan is extended by the workers if a search has more than max_pages pages
+    :param queue: The work queue
+    :param searches: Keyword arguments of ESPCCrawler of each search
+    :param max_pages: Number of pages planned for each search
+    :param pages_per_shard: Number of pages in a shard
+    """
+    for search in searches:
+        for start in range(1, max_pages + 1, pages_per_shard):
+            end = min(start + pages_per_shard - 1, max_pages)
+            put_pages_shard(queue, search, start, end, last=end == max_pages)
+
+
+class Worker:
+    """
+    A worker process which claims shards from the work queue until it is drained. Listing page shards produce one
+    property shard per property url; property shards fetch the details and the SIMD of all versions
+    """
+
+    def __init__(self,
+                 queue: WorkQueue,
+                 worker_id: str = None,
+                 lease_seconds: float = 300,
+                 simd_crawler_factory: Callable[[], SIMDCrawler] = None,
+                 versions: Tuple[int, ...] = SIMD_VERSIONS):
+        """
+        Constructor
+        :param queue: The work queue
+        :param worker_id: Unique id of the worker, defaults to hostname-pid
+        :param lease_seconds: Duration of the lease of a shard, renewed after each SIMD lookup
+        :param simd_crawler_factory: A function creating the SIMDCrawler object, called on the first property shard
+        :param versions: Representing years of the SIMD database
+        """
+        self.queue = queue  # type: WorkQueue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"  # type: str
+        self.lease_seconds = lease_seconds  # type: float
+        self.simd_crawler_factory = simd_crawler_factory or build_simd_crawler
+        self.versions = versions  # type: Tuple[int, ...]
+        self.__simd_crawler = None  # type: SIMDCrawler
+
+    def __repr__(self) -> str:
+        return f"Worker {self.worker_id}"
+
+    @property
+    def simd_crawler(self) -> SIMDCrawler:
+        # The browser is only launched if the worker ever gets a property shard
+        if self.__simd_crawler is None:
+            self.__simd_crawler = self.simd_crawler_factory()
+        return self.__simd_crawler
+
+    def __process_pages(self, shard: Shard) -> dict:
+        search, start, end = shard.payload["search"], shard.payload["start"], shard.payload["end"]
+        espc_crawler = ESPCCrawler(**search, use_mp=False)
+        property_num = 0
+        for page in range(start, end + 1):
+            property_urls = espc_crawler.get_property_urls_on_page(page)
+            if not property_urls:
+                break
+
+            for url in property_urls:
+                # The key avoids duplication due to advertisement, across pages and searches
+                url = canonical_property_url(url)
+                self.queue.put("property", {"url": url, "search": search}, key=f"property:{url}")
+            property_num += property_urls.__len__()
+        else:
+            if shard.payload["last"]:
+                pages_per_shard = end - start + 1
+                put_pages_shard(self.queue, search, end + 1, end + pages_per_shard, last=True)
+
+        return {"property_num": property_num}
+
+    def __process_property(self, shard: Shard) -> dict:
+        url = shard.payload["url"]
+        property_info = ESPCPropertyInfo.init_from_url(url)
+        result = {"detail": property_info.__dict__}
+        for version in self.versions:
+            self.simd_crawler.update_version(version)
+            result[f"simd_{version}"] = self.simd_crawler.clear_and_search(property_info.postcode).__dict__
+            if not self.queue.renew(shard, self.lease_seconds):
+                raise RuntimeError(f"Lease of {shard} lost")
+
+        return result
+
+    def process(self, shard: Shard) -> None:
+        """
+        Process a claimed shard, and complete it or give it back
+        :param shard: The claimed shard
+        """
+        print(f"{self} processing {shard}: {shard.payload}")
+        try:
+            if shard.kind == "pages":
+                result = self.__process_pages(shard)
+            elif shard.kind == "property":
+                result = self.__process_property(shard)
+            else:
+                raise ValueError(f"Unknown shard kind={shard.kind}")
+        except Exception as e:
+            print("############################ERROR HAPPEN############################")
+            print(e)
+            self.queue.fail(shard, e)
+            return
+
+        if not self.queue.complete(shard, result):
+            print(f"Result of {shard} discarded, its lease has expired")
+
+    def run(self, poll_seconds: float = 5) -> None:
+        """
+        Claim and process shards until the queue is drained
+        :param poll_seconds: Seconds to wait when all remaining shards are leased by other workers
+        """
+        try:
+            while True:
+                shard = self.queue.claim(self.worker_id, self.lease_seconds)
+                if shard is not None:
+                    self.process(shard)
+                elif self.queue.is_drained():
+                    break
+                else:
+                    # Shards leased by other workers may expire or produce new shards
+                    time.sleep(poll_seconds)
+        finally:
+            if self.__simd_crawler is not None:
+                self.__simd_crawler.close()
+
+
+def collect(queue: WorkQueue) -> None:
+    """
+    Write the results of all property shards, as main.main does
+    :param queue: The work queue
+    """
+    properties = []
+    simds = {version: [] for version in SIMD_VERSIONS}
+    for payload, result in queue.iter_results("property"):
+        properties.append(ESPCPropertyInfo(**result["detail"]))
+        for version in SIMD_VERSIONS:
+            simds[version].append(SIMDInfo(**result[f"simd_{version}"]))
+    form_dataframe_and_save_all(properties, simds[2020], simds[2016], simds[2012])
+
+    with open('unresolved.json', 'w') as f:
+        # The same list of property urls as written by main.main
+        json.dump([payload["url"] for kind, payload, error in queue.iter_failures() if kind == "property"], f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl espc.com and simd.scot with workers sharing a queue")
+    parser.add_argument("role", choices=["coordinator", "worker", "collect"])
+    parser.add_argument("--queue", default="./queue.sqlite3", help="Path to the SQLite file shared by all nodes")
+    parser.add_argument("--search", action="append", type=json.loads,
+                        help=f"Keyword arguments of ESPCCrawler as JSON, can be repeated. "
+                             f"Defaults to {json.dumps(DEFAULT_SEARCH)}")
+    parser.add_argument("--max-pages", type=int, default=20)
+    parser.add_argument("--pages-per-shard", type=int, default=2)
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--lean", action="store_true",
+                        help="Use the lightweight browser profile, without images, map tiles or fonts")
+    parser.add_argument("--attach-session", type=int, default=None,
+                        help="Use this session of the running browser daemon instead of launching a browser")
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(args.queue)
+    if args.role == "coordinator":
+        enqueue_searches(work_queue, args.search or [DEFAULT_SEARCH], args.max_pages, args.pages_per_shard)
+        print(work_queue.counts())
+    elif args.role == "worker":
+        Worker(work_queue, lease_seconds=args.lease_seconds,
+               simd_crawler_factory=lambda: build_simd_crawler(args.lean, args.attach_session)).run()
+    else:
+        collect(work_queue)
+    work_queue.close()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import datetime
+import json
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class CrawlJournal:
+    """
+    A durable record of a crawl stored in SQLite. It keeps the listing pages done, the property urls discovered and
+    the completion (with its result) or failure of every stage of every property, so that an interrupted crawl can be
+    resumed where it stopped
+    """
+
+    def __init__(self, path: str = "./journal.sqlite3", stages: Tuple[str, ...] = ("detail",)):
+        """
+        Constructor
+        :param path: Path to the SQLite file
+        :param stages: Names of the stages a property must complete, in order, e.g., ("detail", "simd_2020")
+        """
+        self.path = path  # type: str
+        self.stages = tuple(stages)  # type: Tuple[str, ...]
+        # Autocommit, every record is durable once the call returns
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page INTEGER PRIMARY KEY,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS properties (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                page INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                url TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                done INTEGER NOT NULL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (url, stage)
+            );
+            CREATE TABLE IF NOT EXISTS duplicates (
+                url TEXT PRIMARY KEY,
+                original TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.__mark_started()
+
+    def __repr__(self) -> str:
+        return f"Crawl journal at {self.path}"
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def reset(self) -> None:
+        """
+        Forget everything recorded, i.e., start a new crawl
+        """
+        self.connection.executescript("""
+            DELETE FROM pages;
+            DELETE FROM properties;
+            DELETE FROM stages;
+            DELETE FROM duplicates;
+            DELETE FROM meta;
+        """)
+        self.__mark_started()
+
+    def __mark_started(self) -> None:
+        """
+        Record the start of the crawl, unless it is already recorded (i.e., the crawl is resumed)
+        """
+        self.connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('started', ?)",
+                                (datetime.datetime.now().isoformat(timespec="seconds"),))
+
+    def started_at(self) -> datetime.datetime:
+        """
+        :return When the crawl was started, which stays the same when the crawl is resumed
+        """
+        (value,) = self.connection.execute("SELECT value FROM meta WHERE key = 'started'").fetchone()
+        return datetime.datetime.fromisoformat(value)
+
+    def add_page(self, page: int, property_urls: List[str]) -> List[str]:
+        """
+        Record the property urls discovered on a listing page
+        :param page: The page number
+        :param property_urls: All property urls on the page
+        :return The property urls not discovered before (e.g., on a previous page, due to advertisement)
+        """
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("INSERT OR IGNORE INTO pages (page) VALUES (?)", (page,))
+            new_urls = []
+            for url in property_urls:
+                cursor = self.connection.execute("INSERT OR IGNORE INTO properties (url, page) VALUES (?, ?)",
+                                                 (url, page))
+                if cursor.rowcount:
+                    new_urls.append(url)
+
+        return new_urls
+
+    def mark_page_done(self, page: int) -> None:
+        """
+        Record that every property on a listing page has been processed (successfully or not)
+        :param page: The page number
+        """
+        self.connection.execute("UPDATE pages SET done = 1 WHERE page = ?", (page,))
+
+    def next_page(self) -> int:
+        """
+        :return The first listing page not done yet
+        """
+        page = 1
+        for (done_page,) in self.connection.execute("SELECT page FROM pages WHERE done = 1 ORDER BY page"):
+            if done_page != page:
+                break
+            page += 1
+
+        return page
+
+    def mark_finished(self) -> None:
+        """
+        Record that the last listing page has been reached
+        """
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('finished', '1')")
+
+    def is_finished(self) -> bool:
+        return self.connection.execute("SELECT 1 FROM meta WHERE key = 'finished'").fetchone() is not None
+
+    def record_done(self, url: str, stage: str, result: dict) -> None:
+        """
+        Record the completion of a stage
+        :param url: The property url
+        :param stage: Name of the stage
+        :param result: JSON serialisable result of the stage, e.g., the __dict__ of an ESPCPropertyInfo object
+        """
+        self.connection.execute("INSERT OR REPLACE INTO stages (url, stage, done, result, error) "
+                                "VALUES (?, ?, 1, ?, NULL)", (url, stage, json.dumps(result)))
+
+    def record_failure(self, url: str, stage: str, error: Exception | str) -> None:
+        """
+        Record the failure of a stage
+        :param url: The property url
+        :param stage: Name of the stage
+        :param error: The exception encountered
+        """
+        self.connection.execute("INSERT OR REPLACE INTO stages (url, stage, done, result, error) "
+                                "VALUES (?, ?, 0, NULL, ?)", (url, stage, repr(error)))
+
+    def mark_duplicate(self, url: str, original: str) -> None:
+        """
+        Record that a property is the same as another one, so that its stages are not run
+        :param url: The property url
+        :param original: url of the property it is a duplicate of
+        """
+        self.connection.execute("INSERT OR REPLACE INTO duplicates (url, original) VALUES (?, ?)", (url, original))
+
+    def duplicates(self) -> List[Tuple[str, str]]:
+        """
+        :return The (url, original) of all properties marked as duplicates
+        """
+        return self.connection.execute("SELECT url, original FROM duplicates ORDER BY rowid").fetchall()
+
+    def get_result(self, url: str, stage: str) -> Optional[dict]:
+        """
+        :param url: The property url
+        :param stage: Name of the stage
+        :return The result of the stage if it is done, None otherwise
+        """
+        row = self.connection.execute("SELECT result FROM stages WHERE url = ? AND stage = ? AND done = 1",
+                                      (url, stage)).fetchone()
+
+        return None if row is None else json.loads(row[0])
+
+    def __iter_urls(self, resolved: bool) -> Iterator[str]:
+        """
+        :param resolved: Whether to iterate the property urls with all stages done, or those with any stage not done.
+        Duplicates are neither
+        :return An iterator of property urls, in discovery order
+        """
+        query = f"""
+            SELECT properties.url FROM properties
+            LEFT JOIN stages ON stages.url = properties.url AND stages.done = 1
+                AND stages.stage IN ({", ".join("?" * len(self.stages))})
+            WHERE properties.url NOT IN (SELECT url FROM duplicates)
+            GROUP BY properties.id
+            HAVING COUNT(stages.stage) {"=" if resolved else "<"} ?
+            ORDER BY properties.id
+        """
+        for (url,) in self.connection.execute(query, (*self.stages, len(self.stages))):
+            yield url
+
+    def unresolved_urls(self) -> List[str]:
+        """
+        :return The property urls discovered but with any stage failed or not run yet (duplicates excluded), in
+        discovery order
+        """
+        return list(self.__iter_urls(resolved=False))
+
+    def iter_resolved(self) -> Iterator[Tuple[str, Dict[str, dict]]]:
+        """
+        Iterate the property urls with all stages done, in discovery order
+        :return An iterator of (url, {stage: result})
+        """
+        for url in self.__iter_urls(resolved=True):
+            results = {stage: json.loads(result) for stage, result in self.connection.execute(
+                "SELECT stage, result FROM stages WHERE url = ? AND done = 1", (url,))}
+            yield url, results
+
+    def iter_results(self, stage: str) -> Iterator[Tuple[str, dict]]:
+        """
+        Iterate the property urls with a stage done, whether their other stages are done or not, in discovery order
+        :param stage: Name of the stage
+        :return An iterator of (url, result)
+        """
+        for url, result in self.connection.execute("""
+            SELECT properties.url, stages.result FROM properties
+            JOIN stages ON stages.url = properties.url AND stages.stage = ? AND stages.done = 1
+            ORDER BY properties.id
+        """, (stage,)):
+            yield url, json.loads(result)
+
+    def failures(self) -> List[Tuple[str, str, str]]:
+        """
+        :return The (url, stage, error) of all failed stages
+        """
+        return self.connection.execute("SELECT url, stage, error FROM stages WHERE done = 0").fetchall()
@@ -1,7 +1,13 @@
+from __future__ import annotations
+
 from ESPC import ESPCCrawler, ESPCPropertyInfo
 from SIMD import SIMDCrawler, SIMDInfoVariation, SIMDInfo
-import pandas as pd
-from typing import List
+from dedup import DuplicateDetector
+from journal import CrawlJournal
+from pipeline import EnrichedPropertyInfo
+import profiling
+from typing import Iterator, List
+import argparse
 import json
 
 
@@ -9,6 +15,8 @@ def form_dataframe_and_save_all(properties: List[ESPCPropertyInfo],
                                 simds_2020: List[SIMDInfo],
                                 simds_2016: List[SIMDInfo],
                                 simds_2012: List[SIMDInfo]):
+    import pandas as pd
+
     print("Writing results...")
     all_info = pd.DataFrame(
         index=range(properties.__len__()),
@@ -63,56 +71,247 @@ def simd_crawler_search(simd_crawler, postcode, version):
     return simd
 
 
-def main():
-    espc_crawler = ESPCCrawler("edinburgh", "1plus", "210000", "flat,house", use_mp=True)
+def build_simd_crawler(lean: bool = False, attach_session: int = None) -> SIMDCrawler:
+    """
+    Create the crawler of simd.scot. SIMDHTTPCrawler is not offered here, as the data requests it assumes have not
+    been checked against the live site
+    :param lean: Whether to use the lightweight browser profile of SIMDCrawler
+    :param attach_session: Index of the session of the running browser daemon to attach to, instead of launching a
+    browser (lean is then set by the daemon)
+    :return The SIMDCrawler object
+    """
+    if attach_session is None:
+        return SIMDCrawler(use_headless=True, version=2020, lean=lean)
+
+    from browser_daemon import attach
+    return attach(version=2020, session_index=attach_session)
+
+
+DEFAULT_SEARCH = {"location": "edinburgh", "min_beds": "1plus", "max_price": "210000", "property_type": "flat,house"}
+OUTPUTS = ("csv", "parquet")
+SIMD_VERSIONS = (2020, 2016, 2012)
+STAGES = ("detail",) + tuple(f"simd_{version}" for version in SIMD_VERSIONS)
+
+
+def resolve_property(journal: CrawlJournal, simd_crawler: SIMDCrawler, url: str,
+                     property_info: ESPCPropertyInfo = None) -> None:
+    """
+    Run the stages of a property not done yet, recording each result or failure in the journal
+    :param journal: The journal of the crawl
+    :param simd_crawler: The SIMDCrawler object
+    :param url: The property url
+    :param property_info: The ESPCPropertyInfo object, if already fetched
+    """
+    print(f"Getting results for property url={url}")
+    if property_info is None:
+        detail = journal.get_result(url, "detail")
+        try:
+            property_info = ESPCPropertyInfo(**detail) if detail else ESPCPropertyInfo.init_from_url(url)
+        except Exception as e:
+            journal.record_failure(url, "detail", e)
+            print("############################ERROR HAPPEN############################")
+            print(e)
+            return
+        journal.record_done(url, "detail", property_info.__dict__)
+
+    postcode = property_info.postcode
+    print(f"postcode = {postcode}")
+    for version in SIMD_VERSIONS:
+        stage = f"simd_{version}"
+        if journal.get_result(url, stage) is not None:
+            continue
+
+        try:
+            simd = simd_crawler_search(simd_crawler, postcode, version)
+        except Exception as e:
+            journal.record_failure(url, stage, e)
+            print("############################ERROR HAPPEN############################")
+            print(e)
+            return
+        journal.record_done(url, stage, simd.__dict__)
+
+
+def iter_journal_records(journal: CrawlJournal) -> Iterator[EnrichedPropertyInfo]:
+    """
+    Iterate the resolved properties of a crawl, e.g., to query them with query.PropertyIndex:
+    PropertyIndex(iter_journal_records(CrawlJournal("./journal.sqlite3", STAGES)))
+    :param journal: The journal of the crawl
+    :return An iterator of EnrichedPropertyInfo objects, in discovery order
+    """
+    for url, results in journal.iter_resolved():
+        yield EnrichedPropertyInfo(
+            property_info=ESPCPropertyInfo(**results["detail"]),
+            simds={version: SIMDInfo(**results[f"simd_{version}"]) for version in SIMD_VERSIONS}
+        )
+
+
+def save_all(journal: CrawlJournal, output: str = "csv", output_root: str = "./crawls") -> None:
+    """
+    Write the unresolved property urls and the results of all resolved properties
+    :param journal: The journal of the crawl
+    :param output: "csv" for all_info.csv and selected_info.csv, or "parquet" for the typed dataset of columnar.py
+    :param output_root: Root directory of the Parquet dataset
+    """
+    with open('unresolved.json', 'w') as f:
+        json.dump(journal.unresolved_urls(), f)
+
+    if output == "parquet":
+        from columnar import write_parquet
+
+        # Dated by the start of the crawl, so that a resumed crawl replaces its own partition
+        path = write_parquet(iter_journal_records(journal), output_root, DEFAULT_SEARCH,
+                             crawl_date=journal.started_at().date(), versions=SIMD_VERSIONS)
+        print(f"Results written to {path}")
+        return
+
     properties = []
-    simds_2020, simds_2016, simds_2012 = [], [], []
-    urls = set()  # Avoid duplication due to advertisement
-    url_with_error = []
+    simds = {version: [] for version in SIMD_VERSIONS}
+    for record in iter_journal_records(journal):
+        properties.append(record.property_info)
+        for version in SIMD_VERSIONS:
+            simds[version].append(record.simds[version])
+    with profiling.memory_snapshots("form_dataframe_and_save_all"):
+        form_dataframe_and_save_all(properties, simds[2020], simds[2016], simds[2012])
+
+
+def record_price_history(journal: CrawlJournal, price_history_path: str) -> None:
+    """
+    Record the prices of the crawl in the price history. Listings not seen are delisted only if the crawl is finished
+    :param journal: The journal of the crawl
+    :param price_history_path: Path to the price history, see price_history.PriceHistoryStore
+    """
+    from price_history import PriceHistoryStore
+
+    store = PriceHistoryStore(price_history_path)
     try:
-        simd_crawler = SIMDCrawler(use_headless=True, version=2020)
-        for page, property_infos in enumerate(espc_crawler):
-            print(f"Start on page={page + 1}")
-            for property_info in property_infos:
-                if property_info.url in urls:
-                    continue
-                else:
-                    urls.add(property_info.url)
-
-                try:
-                    print(f"Getting results for property url={property_info.url}")
-                    postcode = property_info.postcode
-                    print(f"postcode = {postcode}")
-
-                    simd_2020 = simd_crawler_search(simd_crawler, postcode, 2020)
-                    simd_2016 = simd_crawler_search(simd_crawler, postcode, 2016)
-                    simd_2012 = simd_crawler_search(simd_crawler, postcode, 2012)
-                    # Append
-                except Exception as e:
-                    url_with_error.append(property_info.url)
-                    # Save temp results
-                    url_with_error_json = json.dumps(url_with_error)
-                    with open('unresolved.json', 'w') as f:
-                        json.dump(url_with_error_json, f)
-                    form_dataframe_and_save_all(properties, simds_2020, simds_2016, simds_2012)
+        change_num = store.record(
+            (ESPCPropertyInfo(**detail) for url, detail in journal.iter_results("detail")),
+            mark_missing=journal.is_finished(),
+            listed_urls=journal.unresolved_urls() + [url for url, original in journal.duplicates()]
+        )
+        print(f"{change_num} price changes recorded in {store}")
+    finally:
+        store.close()
+
+
+def build_duplicate_detector(journal: CrawlJournal) -> DuplicateDetector:
+    """
+    :param journal: The journal of the crawl
+    :return A DuplicateDetector object knowing the properties whose details are in the journal
+    """
+    duplicate_detector = DuplicateDetector()
+    for url, detail in journal.iter_results("detail"):
+        duplicate_detector.add(ESPCPropertyInfo(**detail))
+
+    return duplicate_detector
+
 
+def skip_duplicate(journal: CrawlJournal, url: str, original: str | None) -> bool:
+    """
+    Record a property as a duplicate if it is one
+    :param journal: The journal of the crawl
+    :param url: The property url
+    :param original: url of the property it is a duplicate of, None if it is not a duplicate
+    :return Whether the property is a duplicate, i.e., to be skipped
+    """
+    if original is None:
+        return False
+
+    print(f"Skip property url={url}, duplicate of {original}")
+    journal.mark_duplicate(url, original)
+    return True
+
+
+def main(resume: bool = False, journal_path: str = "./journal.sqlite3", lean: bool = False,
+         attach_session: int = None, output: str = "csv", output_root: str = "./crawls",
+         price_history_path: str = None, dedup: bool = True, profile: str = None, profile_dir: str = "./profiles"):
+    """
+    Crawl espc.com and simd.scot, recording the progress in a journal
+    :param resume: Whether to resume the crawl recorded in the journal rather than starting a new one
+    :param journal_path: Path to the journal
+    :param lean: Whether to use the lightweight browser profile of SIMDCrawler
+    :param attach_session: Index of the session of the running browser daemon to use, see browser_daemon.py
+    :param output: "csv", or "parquet" for the typed dataset partitioned by crawl date and search
+    :param output_root: Root directory of the Parquet dataset
+    :param price_history_path: Path to the price history to record the crawl in, not recorded if None
+    :param dedup: Whether to skip the SIMD lookups of the properties already crawled under another url (relisted, or
+    listed by another agent), see dedup.DuplicateDetector. Their urls are recorded in the journal, see
+    CrawlJournal.duplicates
+    :param profile: "cprofile" or "sample" to profile the crawl in this process and in the worker processes, with
+    tracemalloc snapshots around form_dataframe_and_save_all, see profiling.py. Not profiled if None
+    :param profile_dir: Directory of the profiles
+    """
+    if profile:
+        print(f"Profiling with {profile} to {profiling.start(profile, profile_dir)}")
+    espc_crawler = ESPCCrawler(**DEFAULT_SEARCH, use_mp=True)
+    journal = CrawlJournal(journal_path, STAGES)
+    if not resume:
+        journal.reset()
+    try:
+        simd_crawler = build_simd_crawler(lean, attach_session)
+        duplicate_detector = build_duplicate_detector(journal) if dedup else None
+        # Retry the properties failed or interrupted in the previous run
+        for url in journal.unresolved_urls():
+            resolve_property(journal, simd_crawler, url)
+
+        page = journal.next_page()
+        while not journal.is_finished():
+            print(f"Start on page={page}")
+            property_urls = espc_crawler.get_property_urls_on_page(page)
+            if not property_urls:
+                journal.mark_finished()
+                break
+
+            # Avoid duplication due to advertisement
+            property_urls = journal.add_page(page, property_urls)
+            property_infos = espc_crawler.fetch_property_infos(property_urls, return_exceptions=True)
+            for url, property_info in zip(property_urls, property_infos):
+                if isinstance(property_info, Exception):
+                    journal.record_failure(url, "detail", property_info)
                     print("############################ERROR HAPPEN############################")
-                    print(e)
+                    print(property_info)
+                    continue
+
+                journal.record_done(url, "detail", property_info.__dict__)
+                # Before the SIMD lookups, but after recording the details, so that the price of a relisted property
+                # (e.g., cut) reaches the price history
+                if dedup and skip_duplicate(journal, url, duplicate_detector.add(property_info)):
                     continue
-                finally:
-                    pass
+                resolve_property(journal, simd_crawler, url, property_info)
 
-                properties.append(property_info)
-                simds_2020.append(simd_2020)
-                simds_2016.append(simd_2016)
-                simds_2012.append(simd_2012)
+            journal.mark_page_done(page)
+            page += 1
 
     finally:
-        url_with_error_json = json.dumps(url_with_error)
-        with open('unresolved.json', 'w') as f:
-            json.dump(url_with_error_json, f)
-        form_dataframe_and_save_all(properties, simds_2020, simds_2016, simds_2012)
+        save_all(journal, output, output_root)
+        if price_history_path:
+            record_price_history(journal, price_history_path)
+        journal.close()
+        if profile:
+            print(f"Profile report written to {profiling.finish()}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Crawl espc.com and simd.scot")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume the previous crawl, retrying only the unresolved properties")
+    parser.add_argument("--journal", default="./journal.sqlite3", help="Path to the journal of the crawl")
+    parser.add_argument("--lean", action="store_true",
+                        help="Use the lightweight browser profile, without images, map tiles or fonts")
+    parser.add_argument("--attach-session", type=int, default=None,
+                        help="Use this session of the running browser daemon instead of launching a browser")
+    parser.add_argument("--output", choices=OUTPUTS, default="csv",
+                        help="Write CSV files, or a typed Parquet dataset partitioned by crawl date and search")
+    parser.add_argument("--output-root", default="./crawls", help="Root directory of the Parquet dataset")
+    parser.add_argument("--price-history", default=None,
+                        help="Path to the price history (SQLite) to record the prices of the crawl in")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Do not skip the SIMD lookups of the properties already crawled under another url")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES, default=None,
+                        help="Profile this process and the worker processes, with cProfile or by sampling stacks")
+    parser.add_argument("--profile-dir", default="./profiles", help="Directory of the profiles")
+    args = parser.parse_args()
+    main(resume=args.resume, journal_path=args.journal, lean=args.lean, attach_session=args.attach_session,
+         output=args.output, output_root=args.output_root,
+         price_history_path=args.price_history, dedup=not args.no_dedup, profile=args.profile,
+         profile_dir=args.profile_dir)
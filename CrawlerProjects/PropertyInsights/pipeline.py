@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from ESPC import ESPCCrawler, ESPCPropertyInfo, print_error
+from SIMD import SIMDCrawler, SIMDInfo
+from typing import Callable, Dict, Iterator, Tuple
+
+SIMD_NOT_INTERESTED_FIELDS = {"postcode", "version"}  # Already given by the property, or by the column name
+
+
+class EnrichedPropertyInfo:
+    """
+    A property joined with its SIMD of different years
+    """
+
+    def __init__(self, *, property_info: ESPCPropertyInfo, simds: Dict[int, SIMDInfo]):
+        """
+        Constructor
+        :param property_info: The ESPCPropertyInfo object
+        :param simds: SIMDInfo objects at the postcode of the property, keyed by version
+        """
+        self.property_info = property_info  # type: ESPCPropertyInfo
+        self.simds = simds  # type: Dict[int, SIMDInfo]
+
+    def __repr__(self) -> str:
+        return f"{self.property_info} with SIMD {sorted(self.simds)}"
+
+    def to_row(self) -> dict:
+        """
+        Flatten into one row, SIMD fields being prefixed by their version, e.g., "simd_2020_overall_rank_bar"
+        :return A dict of column name to value
+        """
+        row = dict(self.property_info.__dict__)
+        for version, simd in self.simds.items():
+            for field, value in simd.__dict__.items():
+                if field not in SIMD_NOT_INTERESTED_FIELDS:
+                    row[f"simd_{version}_{field}"] = value
+
+        return row
+
+
+def iter_enriched(search: ESPCCrawler | dict,
+                  versions: Tuple[int, ...] = (2020, 2016, 2012),
+                  simd_crawler: SIMDCrawler = None,
+                  max_in_flight: int = None,
+                  on_error: Callable[[str, str, Exception], None] = None) -> Iterator[EnrichedPropertyInfo]:
+    """
+    Yield the properties of a search joined with their SIMD, one at a time. Memory stays flat whatever the number of
+    pages: only the urls of the current page, the pending detail requests and the urls seen (to skip duplicates due to
+    advertisement) are held
+    :param search: An ESPCCrawler object (or any object with its iter_property_infos), or its keyword arguments
+    :param versions: Representing years of the SIMD database
+    :param simd_crawler: A SIMDCrawler (or SIMDHTTPCrawler) object. If not given, one is created and closed at the end
+    :param max_in_flight: Maximum number of detail requests sent but not yet yielded, see
+    ESPCCrawler.iter_property_infos
+    :param on_error: Called as on_error(url, stage, exception) for each property skipped because its "detail" or
+    "simd_<version>" stage failed, e.g., CrawlJournal.record_failure. Defaults to printing the error
+    :return An iterator of EnrichedPropertyInfo objects
+    """
+    on_error = on_error or print_error
+    espc_crawler = ESPCCrawler(**search) if isinstance(search, dict) else search
+    own_simd_crawler = simd_crawler is None
+    if own_simd_crawler:
+        simd_crawler = SIMDCrawler(use_headless=True, version=versions[0])
+
+    urls = set()
+    try:
+        for property_info in espc_crawler.iter_property_infos(max_in_flight, on_error):
+            if property_info.url in urls:
+                continue
+            urls.add(property_info.url)
+
+            simds = {}
+            for version in versions:
+                try:
+                    simd_crawler.update_version(version)
+                    simds[version] = simd_crawler.clear_and_search(property_info.postcode)
+                except Exception as e:
+                    on_error(property_info.url, f"simd_{version}", e)
+                    break
+            else:
+                yield EnrichedPropertyInfo(property_info=property_info, simds=simds)
+    finally:
+        if own_simd_crawler:
+            simd_crawler.close()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import time
+from ESPC import ESPCPropertyInfo, canonical_property_url
+from typing import Iterable, List, Tuple
+
+LISTED = "listed"
+DELISTED = "delisted"
+
+
+def listing_id_from_url(url: str) -> int:
+    """
+    The canonical id of a listing, i.e., the numeric suffix of its url
+    :param url: url of the property, e.g., https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521
+    :return The id, e.g., 36101521
+    """
+    found = re.findall(r"/(\d+)/?$", canonical_property_url(url))
+    if found.__len__() == 0:
+        raise ValueError(f"Unable to find listing id in url={url}")
+
+    return int(found[0])
+
+
+class PriceChange:
+    """
+    A change of price, price type or status of a listing
+    """
+
+    def __init__(self, *,
+                 listing_id: int,
+                 observed_at: int,
+                 price: int,
+                 prev_price: int | None,
+                 price_type: str,
+                 prev_price_type: str | None,
+                 status: str,
+                 prev_status: str | None,
+                 url: str = ""):
+        """
+        Constructor
+        :param listing_id: id of the listing, see listing_id_from_url
+        :param observed_at: When the change was observed, in seconds since epoch
+        :param price: Price after the change
+        :param prev_price: Price before the change, None for the first observation
+        :param price_type: Price type after the change, e.g., "offers over"
+        :param prev_price_type: Price type before the change
+        :param status: LISTED or DELISTED
+        :param prev_status: Status before the change
+        :param url: url of the listing
+        """
+        self.listing_id = listing_id  # type: int
+        self.observed_at = observed_at  # type: int
+        self.price = price  # type: int
+        self.prev_price = prev_price  # type: int | None
+        self.price_type = price_type  # type: str
+        self.prev_price_type = prev_price_type  # type: str | None
+        self.status = status  # type: str
+        self.prev_status = prev_status  # type: str | None
+        self.url = url  # type: str
+
+    def __repr__(self) -> str:
+        return f"Listing {self.listing_id} at {self.observed_at}: {self.prev_price} -> {self.price} ({self.status})"
+
+
+class PriceHistoryStore:
+    """
+    An append-only history of listings stored in SQLite. Only changes are stored (each with the previous values, so
+    that a change can be queried without looking at the observation before it): rerunning the crawl on unchanged
+    listings only updates when they were last seen
+    """
+
+    COLUMNS = "listing_id, observed_at, price, prev_price, price_type, prev_price_type, status, prev_status"
+
+    def __init__(self, path: str = "./price_history.sqlite3"):
+        """
+        Constructor
+        :param path: Path to the SQLite file
+        """
+        self.path = path  # type: str
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS listings (
+                listing_id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                price INTEGER NOT NULL,
+                price_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                listing_id INTEGER NOT NULL,
+                observed_at INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                prev_price INTEGER,
+                price_type TEXT NOT NULL,
+                prev_price_type TEXT,
+                status TEXT NOT NULL,
+                prev_status TEXT
+            );
+            CREATE INDEX IF NOT EXISTS changes_listing ON changes (listing_id, observed_at);
+            CREATE INDEX IF NOT EXISTS changes_observed_at ON changes (observed_at);
+            CREATE INDEX IF NOT EXISTS changes_price_drops ON changes (observed_at, price) WHERE price < prev_price;
+        """)
+
+    def __repr__(self) -> str:
+        return f"Price history at {self.path}"
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __append_change(self, listing_id: int, observed_at: int, price: int, price_type: str, status: str,
+                        previous: Tuple[int, str, str] | None) -> None:
+        prev_price, prev_price_type, prev_status = previous or (None, None, None)
+        self.connection.execute(f"INSERT INTO changes ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (listing_id, observed_at, price, prev_price, price_type, prev_price_type, status,
+                                 prev_status))
+
+    def record(self, property_infos: Iterable[ESPCPropertyInfo], observed_at: int = None,
+               mark_missing: bool = False, listed_urls: Iterable[str] = ()) -> int:
+        """
+        Record a crawl
+        :param property_infos: ESPCPropertyInfo objects seen by the crawl
+        :param observed_at: When the crawl was done, in seconds since epoch, defaults to now
+        :param mark_missing: Whether the crawl is complete, so that the listed listings it has not seen are delisted
+        :param listed_urls: urls seen on the listing pages but whose details are unknown (e.g., their detail request
+        failed), so that they are not delisted
+        :return Number of changes recorded
+        """
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        change_num = 0
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen (listing_id INTEGER PRIMARY KEY)")
+            self.connection.execute("DELETE FROM seen")
+            for property_info in property_infos:
+                listing_id = listing_id_from_url(property_info.url)
+                price, price_type = property_info.price_val, property_info.price_type
+                self.connection.execute("INSERT OR IGNORE INTO seen (listing_id) VALUES (?)", (listing_id,))
+                previous = self.connection.execute("SELECT price, price_type, status FROM listings WHERE listing_id = ?",
+                                                   (listing_id,)).fetchone()
+                if previous is None:
+                    self.connection.execute("""
+                        INSERT INTO listings (listing_id, url, price, price_type, status, first_seen, last_seen)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (listing_id, canonical_property_url(property_info.url), price, price_type, LISTED,
+                          observed_at, observed_at))
+                elif previous != (price, price_type, LISTED):
+                    self.connection.execute("""
+                        UPDATE listings SET price = ?, price_type = ?, status = ?, last_seen = ? WHERE listing_id = ?
+                    """, (price, price_type, LISTED, observed_at, listing_id))
+                else:
+                    self.connection.execute("UPDATE listings SET last_seen = ? WHERE listing_id = ?",
+                                            (observed_at, listing_id))
+                    continue
+
+                self.__append_change(listing_id, observed_at, price, price_type, LISTED, previous)
+                change_num += 1
+
+            for url in listed_urls:
+                self.connection.execute("INSERT OR IGNORE INTO seen (listing_id) VALUES (?)",
+                                        (listing_id_from_url(url),))
+
+            if mark_missing:
+                missing = self.connection.execute("""
+                    SELECT listing_id, price, price_type, status FROM listings
+                    WHERE status = ? AND listing_id NOT IN (SELECT listing_id FROM seen)
+                """, (LISTED,)).fetchall()
+                for listing_id, price, price_type, status in missing:
+                    self.connection.execute("UPDATE listings SET status = ? WHERE listing_id = ?",
+                                            (DELISTED, listing_id))
+                    self.__append_change(listing_id, observed_at, price, price_type, DELISTED,
+                                         (price, price_type, status))
+                    change_num += 1
+
+        return change_num
+
+    def __to_changes(self, rows: List[tuple]) -> List[PriceChange]:
+        return [PriceChange(**dict(zip(self.COLUMNS.split(", ") + ["url"], row))) for row in rows]
+
+    def history(self, listing: int | str) -> List[PriceChange]:
+        """
+        :param listing: id or url of the listing
+        :return All changes of the listing, oldest first
+        """
+        listing_id = listing if isinstance(listing, int) else listing_id_from_url(listing)
+        rows = self.connection.execute(f"""
+            SELECT {self.COLUMNS}, '' FROM changes WHERE listing_id = ? ORDER BY observed_at
+        """, (listing_id,)).fetchall()
+
+        return self.__to_changes(rows)
+
+    def price_drops(self, days: float = 7, max_price: int = None, now: int = None) -> List[PriceChange]:
+        """
+        The price drops observed recently, e.g., price_drops(days=7, max_price=200000) for those in the last 7 days
+        under £200k
+        :param days: How many days to look back
+        :param max_price: Only the drops to a price under it
+        :param now: The end of the period, in seconds since epoch, defaults to now
+        :return The changes, most recent first
+        """
+        now = int(now if now is not None else time.time())
+        since = now - int(days * 24 * 3600)
+        max_price = max_price if max_price is not None else 2 ** 62
+        # Served by the partial index changes_price_drops
+        rows = self.connection.execute(f"""
+            SELECT {", ".join(f"changes.{column}" for column in self.COLUMNS.split(", "))}, listings.url
+            FROM changes INDEXED BY changes_price_drops
+            JOIN listings ON listings.listing_id = changes.listing_id
+            WHERE changes.price < changes.prev_price AND changes.observed_at BETWEEN ? AND ?
+                AND changes.price < ?
+            ORDER BY changes.observed_at DESC
+        """, (since, now, max_price)).fetchall()
+
+        return self.__to_changes(rows)
@@ -0,0 +1,282 @@
+"""
+Profiling of a crawl in the parent process and in every worker process of the multiprocessing pools, switched on per
+run with main.py --profile {cprofile,sample}.
+
+The settings are passed to the workers by environment variables (so that they are inherited whatever the start
+method), and init_worker, the initializer of the pools, starts a profiler in each worker which dumps its profile when
+the worker exits. finish then merges the profiles of all processes of the run:
+    - cprofile: merged.prof (for pstats, snakeviz or gprof2dot) and report.txt
+    - sample: merged.folded, stacks collapsed as for flamegraph.pl or speedscope, and report.txt
+"""
+from __future__ import annotations
+
+import cProfile
+import collections
+import glob
+import multiprocessing as mp
+import multiprocessing.util
+import os
+import pstats
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+PROFILE_MODES = ("cprofile", "sample")
+MODE_ENV = "PROPERTY_INSIGHTS_PROFILE"
+DIRECTORY_ENV = "PROPERTY_INSIGHTS_PROFILE_DIR"
+SAMPLE_INTERVAL = 0.005  # In seconds
+# Dump before the finalizers of multiprocessing (priority 0 and below) tear down the worker
+DUMP_EXIT_PRIORITY = 100
+
+
+def process_label() -> str:
+    """
+    :return Name of the current process without its number, e.g., "MainProcess" or "ForkPoolWorker", so that the
+    workers of a pool are merged together
+    """
+    return re.sub(r"-\d+$", "", mp.current_process().name)
+
+
+class CProfileProfiler:
+    """
+    Deterministic profiling of the main thread with cProfile
+    """
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()  # type: cProfile.Profile
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def dump(self, path: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiling of the main thread: its stack is sampled every interval by another thread. The samples are
+    of wall-clock time, so the time waiting for the network or the browser shows as well as the time computing, and
+    the overhead does not depend on the number of calls. While the main thread computes, a sample waits for the GIL
+    (see sys.getswitchinterval), so compare the shares of the samples rather than their number
+    """
+    extension = "folded"
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        """
+        Constructor
+        :param interval: Time between samples, in seconds
+        """
+        self.interval = interval  # type: float
+        self.stacks = collections.Counter()  # type: collections.Counter[str]
+        self.__root = process_label()
+        self.__stop_event = threading.Event()
+        self.__thread = None  # type: Optional[threading.Thread]
+
+    def start(self) -> None:
+        self.__thread = threading.Thread(target=self.__sample, args=(threading.main_thread().ident,), daemon=True)
+        self.__thread.start()
+
+    def __sample(self, thread_id: int) -> None:
+        while not self.__stop_event.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join([self.__root] + names[::-1])] += 1
+
+    def stop(self) -> None:
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+
+# The profiler of the current process, if profiling
+current_profiler = None  # type: Optional[CProfileProfiler | SamplingProfiler]
+
+
+def new_profiler(mode: str) -> CProfileProfiler | SamplingProfiler:
+    """
+    :param mode: One of PROFILE_MODES
+    :return A profiler, not started
+    """
+    if mode == "cprofile":
+        return CProfileProfiler()
+    elif mode == "sample":
+        return SamplingProfiler()
+    else:
+        raise ValueError(f"Unknown profile mode={mode}")
+
+
+def is_enabled() -> bool:
+    return MODE_ENV in os.environ
+
+
+def start(mode: str, directory: str = "./profiles") -> str:
+    """
+    Start profiling the current process, and the worker processes of the pools created from now on
+    :param mode: One of PROFILE_MODES
+    :param directory: Directory of the profiles, each run writing in its own subdirectory
+    :return The subdirectory of the run
+    """
+    global current_profiler
+
+    run_directory = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    os.makedirs(run_directory, exist_ok=True)
+    os.environ[MODE_ENV] = mode
+    os.environ[DIRECTORY_ENV] = run_directory
+    current_profiler = new_profiler(mode)
+    current_profiler.start()
+
+    return run_directory
+
+
+def dump() -> None:
+    """
+    Stop the profiler of the current process, and write its profile to the directory of the run
+    """
+    global current_profiler
+
+    if current_profiler is None:
+        return
+    current_profiler.stop()
+    path = os.path.join(os.environ[DIRECTORY_ENV],
+                        f"{process_label()}-{os.getpid()}.{current_profiler.extension}")
+    current_profiler.dump(path)
+    current_profiler = None
+
+
+def init_worker() -> None:
+    """
+    Initializer of the worker processes of the pools, e.g., mp.Pool(initializer=init_worker). Does nothing unless
+    profiling
+    """
+    global current_profiler
+
+    if not is_enabled():
+        return
+    if current_profiler is not None:
+        # Inherited from the parent by fork
+        current_profiler.stop()
+    current_profiler = new_profiler(os.environ[MODE_ENV])
+    current_profiler.start()
+    # Run when the worker exits, after the pool is closed
+    multiprocessing.util.Finalize(None, dump, exitpriority=DUMP_EXIT_PRIORITY)
+    # and when it is terminated (on POSIX, pool.terminate sends SIGTERM), which then exits through the finalizers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def merge(directory: str, mode: str) -> str:
+    """
+    Merge the profiles of all processes of a run
+    :param directory: The directory of the run
+    :param mode: One of PROFILE_MODES
+    :return Path to the report
+    """
+    report_path = os.path.join(directory, "report.txt")
+    paths = sorted(glob.glob(os.path.join(directory, f"*.{new_profiler(mode).extension}")))
+    paths = [path for path in paths if not os.path.basename(path).startswith("merged.")]
+    if paths.__len__() == 0:
+        raise ValueError(f"No profile found in {directory}")
+
+    if mode == "cprofile":
+        with open(report_path, "w") as f:
+            stats = pstats.Stats(*paths, stream=f)
+            stats.dump_stats(os.path.join(directory, "merged.prof"))
+            f.write(f"Merged from {paths.__len__()} processes\n")
+            stats.sort_stats("cumulative").print_stats(50)
+            stats.sort_stats("tottime").print_stats(50)
+        return report_path
+
+    stacks = collections.Counter()
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, count = line.rstrip("\n").rsplit(" ", 1)
+                stacks[stack] += int(count)
+    with open(os.path.join(directory, "merged.folded"), "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    # Self samples count the frame at the top of the stack, total samples a frame anywhere in the stack
+    self_samples = collections.Counter()
+    total_samples = collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_samples[frames[-1]] += count
+        for frame in set(frames):
+            total_samples[frame] += count
+    sample_num = sum(stacks.values())
+    with open(report_path, "w") as f:
+        f.write(f"{sample_num} samples from {paths.__len__()} processes\n")
+        for title, samples in (("Self", self_samples), ("Total", total_samples)):
+            f.write(f"\n{title} samples:\n")
+            for frame, count in samples.most_common(50):
+                f.write(f"{count:>10} {100 * count / sample_num:6.2f}%  {frame}\n")
+
+    return report_path
+
+
+def finish() -> str:
+    """
+    Stop profiling the current process, and merge its profile with those of the worker processes (which have exited)
+    :return Path to the report
+    """
+    mode, directory = os.environ[MODE_ENV], os.environ[DIRECTORY_ENV]
+    try:
+        dump()
+    finally:
+        del os.environ[MODE_ENV], os.environ[DIRECTORY_ENV]
+
+    return merge(directory, mode)
+
+
+@contextmanager
+def memory_snapshots(label: str, top: int = 25) -> Iterator[None]:
+    """
+    Trace the memory allocated by a block with tracemalloc, and write the snapshots before and after it with the
+    report of their difference to the directory of the run. Does nothing unless profiling
+    :param label: Name of the block, e.g., "form_dataframe_and_save_all"
+    :param top: Number of lines of the report
+    """
+    if not is_enabled():
+        yield
+        return
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started:
+            tracemalloc.stop()
+
+        directory = os.environ[DIRECTORY_ENV]
+        before.dump(os.path.join(directory, f"{label}-before.tracemalloc"))
+        after.dump(os.path.join(directory, f"{label}-after.tracemalloc"))
+        with open(os.path.join(directory, f"{label}-tracemalloc.txt"), "w") as f:
+            f.write(f"Peak traced memory in {label}: {peak / 1024 / 1024:.1f} MiB, "
+                    f"{current / 1024 / 1024:.1f} MiB at its end\n\n")
+            for diff in after.compare_to(before, "lineno")[:top]:
+                f.write(f"{diff}\n")
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import bisect
+from columnar import PROPERTY_COLUMN_TYPES, simd_column_types
+from pipeline import EnrichedPropertyInfo
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Logical types of columnar.py indexed by value (one bitmap per distinct value), or by a sorted array
+BITMAP_TYPES = {"category", "int8"}
+SORTED_TYPES = {"int32"}
+# Beyond it, a field of BITMAP_TYPES (e.g., the data zone id) is indexed by a sorted array, as its bitmaps would take
+# more memory than they save time
+MAX_BITMAP_NUM = 64
+# Prefix bitmaps of a SortedIndex, each of size / 8 bytes (about 400 KB per sorted field at 100k records). A range
+# query turns at most size / DEFAULT_BUCKET_NUM ids into a bitmap on top of them
+DEFAULT_BUCKET_NUM = 32
+
+
+def to_bitmap(ids: Iterable[int], size: int) -> int:
+    """
+    :param ids: Record ids, each in range(size)
+    :param size: Number of records
+    :return A bitmap (as an int) with the bits of the ids set
+    """
+    bits = bytearray((size + 7) // 8)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+
+    return int.from_bytes(bits, "little")
+
+
+def iter_bitmap(bitmap: int, size: int) -> Iterator[int]:
+    """
+    :param bitmap: A bitmap (as an int) of record ids
+    :param size: Number of records
+    :return An iterator of the ids of the bits set, in ascending order
+    """
+    for byte_i, byte in enumerate(bitmap.to_bytes((size + 7) // 8, "little")):
+        while byte:
+            low_bit = byte & -byte
+            yield (byte_i << 3) + low_bit.bit_length() - 1
+            byte ^= low_bit
+
+
+class SortedIndex:
+    """
+    The record ids sorted by the value of a field. A range of values is a slice of the sorted ids, turned into a bitmap
+    with the bitmaps of the prefixes of the sorted ids precomputed every bucket_size ids
+    """
+
+    def __init__(self, values: List[Any], bucket_num: int = DEFAULT_BUCKET_NUM):
+        """
+        Constructor
+        :param values: Value of the field of each record, indexed by record id
+        :param bucket_num: Number of prefix bitmaps, i.e., memory traded for the speed of range queries. They take
+        (bucket_num + 1) * len(values) / 8 bytes
+        """
+        self.size = values.__len__()  # type: int
+        self.order = sorted(range(self.size), key=values.__getitem__)  # type: List[int]
+        self.values = [values[i] for i in self.order]  # type: List[Any]
+        self.bucket_size = max(1, -(-self.size // bucket_num))  # type: int
+
+        self.prefixes = [0]  # type: List[int]
+        bits = bytearray((self.size + 7) // 8)
+        for start in range(0, self.size, self.bucket_size):
+            for i in self.order[start:start + self.bucket_size]:
+                bits[i >> 3] |= 1 << (i & 7)
+            self.prefixes.append(int.from_bytes(bits, "little"))
+
+    def __repr__(self) -> str:
+        return f"Sorted index of {self.size} records"
+
+    def __prefix(self, position: int) -> int:
+        """
+        :param position: Position in the sorted ids
+        :return The bitmap of the sorted ids before the position
+        """
+        bucket = position // self.bucket_size
+        return self.prefixes[bucket] | to_bitmap(self.order[bucket * self.bucket_size:position], self.size)
+
+    def positions(self, low: Any = None, high: Any = None) -> Tuple[int, int]:
+        """
+        :param low: The lowest value included, None for no bound
+        :param high: The highest value included, None for no bound
+        :return The slice (start, stop) of the sorted ids with their value in the range
+        """
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        stop = self.size if high is None else bisect.bisect_right(self.values, high)
+
+        return start, max(start, stop)
+
+    def bitmap(self, low: Any = None, high: Any = None) -> int:
+        """
+        :param low: The lowest value included, None for no bound
+        :param high: The highest value included, None for no bound
+        :return The bitmap of the records with their value in the range
+        """
+        start, stop = self.positions(low, high)
+        return self.__prefix(stop) & ~self.__prefix(start)
+
+
+class PropertyIndex:
+    """
+    Indexes over the fields of enriched properties, to answer conjunctive queries such as
+    index.query(price_val=(None, 200000), bed_num=(2, None), epc={"A", "B", "C"}) or
+    index.top_k(20, "price_val", simd_2020_overall_rank_bar=(8, None), simd_2016_overall_rank_bar=(8, None))
+    by intersecting bitmaps rather than scanning the records.
+
+    Fields are named as by EnrichedPropertyInfo.to_row. The categorical and small integer fields (e.g., epc, bed_num,
+    SIMD bars) have a bitmap per value, unless they have more than MAX_BITMAP_NUM values (e.g., the data zone id), and
+    the other integer fields (e.g., price_val, floor_area, SIMD ranks) a SortedIndex. Strings such as the title or the
+    address are not indexed. Unknown values (-1 or "") are indexed as they are, so give a lower bound to exclude them.
+
+    Memory: the bitmaps take (bucket_num + 1) * records / 8 bytes per sorted field (about 30 of them with 3 SIMD
+    versions), plus records / 8 bytes per distinct value of the other fields. At 100k records, that is about 13 MB
+    with the default bucket_num=32, and about 100 MB with bucket_num=256
+    """
+
+    def __init__(self, records: Iterable[EnrichedPropertyInfo], versions: Tuple[int, ...] = (2020, 2016, 2012),
+                 bucket_num: int = DEFAULT_BUCKET_NUM):
+        """
+        Constructor
+        :param records: EnrichedPropertyInfo objects, e.g., from iter_enriched
+        :param versions: Years of the SIMD database of the records
+        :param bucket_num: Number of prefix bitmaps of each SortedIndex
+        """
+        self.records = list(records)  # type: List[EnrichedPropertyInfo]
+        self.size = self.records.__len__()  # type: int
+        self.all = (1 << self.size) - 1  # type: int
+
+        column_types = dict(PROPERTY_COLUMN_TYPES)
+        for version in versions:
+            column_types.update(simd_column_types(version))
+        rows = [record.to_row() for record in self.records]
+
+        self.bitmaps = {}  # type: Dict[str, Dict[Any, int]]
+        self.sorted_indexes = {}  # type: Dict[str, SortedIndex]
+        for column, column_type in column_types.items():
+            values = [row[column] for row in rows]
+            if column_type in BITMAP_TYPES:
+                ids = {}
+                for i, value in enumerate(values):
+                    ids.setdefault(value, []).append(i)
+                if ids.__len__() <= MAX_BITMAP_NUM:
+                    self.bitmaps[column] = {value: to_bitmap(value_ids, self.size) for value, value_ids in ids.items()}
+                    continue
+            if column_type in BITMAP_TYPES or column_type in SORTED_TYPES:
+                self.sorted_indexes[column] = SortedIndex(values, bucket_num)
+
+    def __repr__(self) -> str:
+        return f"Index of {self.size} properties"
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __predicate_bitmap(self, field: str, condition: Any) -> int:
+        """
+        :param field: Name of the field
+        :param condition: (low, high) for a range of values, bounds included and None for no bound, a set (or list)
+        of values, or a value
+        :return The bitmap of the records meeting the condition
+        """
+        if isinstance(condition, tuple):
+            low, high = condition
+            if field in self.sorted_indexes:
+                return self.sorted_indexes[field].bitmap(low, high)
+            bitmap = 0
+            for value, value_bitmap in self.bitmaps[field].items():
+                if (low is None or value >= low) and (high is None or value <= high):
+                    bitmap |= value_bitmap
+            return bitmap
+
+        values = condition if isinstance(condition, (set, frozenset, list)) else [condition]
+        bitmap = 0
+        for value in values:
+            if field in self.sorted_indexes:
+                bitmap |= self.sorted_indexes[field].bitmap(value, value)
+            else:
+                bitmap |= self.bitmaps[field].get(value, 0)
+
+        return bitmap
+
+    def match(self, **predicates) -> int:
+        """
+        :param predicates: field=condition, see query
+        :return The bitmap of the records meeting all the conditions
+        """
+        for field in predicates:
+            if field not in self.bitmaps and field not in self.sorted_indexes:
+                raise ValueError(f"Field {field} is not indexed")
+
+        bitmap = self.all
+        for field, condition in predicates.items():
+            bitmap &= self.__predicate_bitmap(field, condition)
+            if not bitmap:
+                break
+
+        return bitmap
+
+    def query(self, **predicates) -> List[EnrichedPropertyInfo]:
+        """
+        The records meeting all the conditions, e.g., query(price_val=(None, 200000), epc={"A", "B", "C"}, bed_num=2)
+        :param predicates: field=condition, where condition is (low, high) for a range of values (bounds included, None
+        for no bound), a set (or list) of values, or a value
+        :return The EnrichedPropertyInfo objects, in the order given to the constructor
+        """
+        return [self.records[i] for i in iter_bitmap(self.match(**predicates), self.size)]
+
+    def top_k(self, k: int, order_by: str, descending: bool = False, **predicates) -> List[EnrichedPropertyInfo]:
+        """
+        The first records by a field among those meeting all the conditions, e.g., the cheapest 20 with all SIMD bars
+        at least 8: top_k(20, "price_val", **{f"simd_{v}_overall_rank_bar": (8, None) for v in (2020, 2016, 2012)})
+        :param k: Maximum number of records
+        :param order_by: Name of the field to sort by, which must have a SortedIndex, e.g., "price_val"
+        :param descending: Whether to start from the highest values
+        :param predicates: field=condition, see query
+        :return The EnrichedPropertyInfo objects
+        """
+        if order_by not in self.sorted_indexes:
+            raise ValueError(f"Field {order_by} has no sorted index")
+
+        bits = self.match(**predicates).to_bytes((self.size + 7) // 8, "little")
+        order = self.sorted_indexes[order_by].order
+        results = []
+        for i in (reversed(order) if descending else order):
+            if bits[i >> 3] >> (i & 7) & 1:
+                results.append(self.records[i])
+                if results.__len__() >= k:
+                    break
+
+        return results
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 from ESPC import ESPCCrawler, ESPCPropertyInfo
 
 # The first property on the first page of
@@ -49,6 +50,149 @@ class TestESPCPropertyInfo(unittest.TestCase):
             self.assertEqual(EXPECTED_PROPERTY_INFO_1.__getattribute__(field), obj.__getattribute__(field))
 
 
+class SyncPool:
+    """
+    Stands in for mp.Pool, runs each task when its result is got and records the maximum number of pending tasks
+    """
+
+    def __init__(self, *args):
+        self.pending = 0
+        self.max_pending = 0
+
+    def apply_async(self, func, args):
+        pool = self
+        pool.pending += 1
+        pool.max_pending = max(pool.max_pending, pool.pending)
+
+        class Result:
+            def get(self):
+                pool.pending -= 1
+                return func(*args)
+
+        return Result()
+
+    def terminate(self):
+        pass
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def init_from_url_offline(url: str) -> ESPCPropertyInfo:
+    if url.endswith("/bad"):
+        raise ValueError("Malformed detail page")
+    return ESPCPropertyInfo(url=url)
+
+
+class TestESPCCrawlerOffline(unittest.TestCase):
+    """
+    Tests of ESPCCrawler.iter_property_infos without sending requests
+    """
+
+    def setUp(self) -> None:
+        pages = {
+            1: ["https://espc.com/property/1", "https://espc.com/property/bad", "https://espc.com/property/2"],
+            2: ["https://espc.com/property/3", "https://espc.com/property/4", "https://espc.com/property/5"],
+        }
+        self.patches = [
+            mock.patch.object(ESPCCrawler, "get_property_urls_on_page", lambda obj, page: pages.get(page, [])),
+            mock.patch.object(ESPCPropertyInfo, "init_from_url", staticmethod(init_from_url_offline)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self) -> None:
+        for patch in self.patches:
+            patch.stop()
+
+    def test_iter_property_infos_skips_failures(self):
+        errors = []
+        obj = ESPCCrawler("edinburgh", "1plus", "210000", "flat,house", use_mp=False)
+        urls = [property_info.url for property_info in obj.iter_property_infos(
+            on_error=lambda url, stage, error: errors.append((url, stage)))]
+
+        self.assertEqual([f"https://espc.com/property/{i}" for i in range(1, 6)], urls)
+        self.assertEqual([("https://espc.com/property/bad", "detail")], errors)
+
+    def test_parse_all_property_urls_from_page_html(self):
+        html = """
+        <div class="infoWrap"><a href="/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521"></a></div>
+        <div class="infoWrap"><a href="/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521?ad=1"></a></div>
+        """
+        url = "https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521"
+
+        self.assertEqual([url, url], ESPCCrawler.parse_all_property_urls_from_page_html(html))
+
+    def test_iter_property_infos_max_in_flight(self):
+        pool = SyncPool()
+        with mock.patch("ESPC.mp.Pool", return_value=pool):
+            obj = ESPCCrawler("edinburgh", "1plus", "210000", "flat,house", use_mp=True)
+            urls = [property_info.url for property_info in obj.iter_property_infos(max_in_flight=2,
+                                                                                   on_error=lambda *args: None)]
+
+        self.assertEqual(5, urls.__len__())
+        self.assertEqual(2, pool.max_pending)
+
+
+class TestESPCCrawlerIndex(unittest.TestCase):
+    """
+    Tests of the page cache and index of ESPCCrawler without sending requests
+    """
+
+    def setUp(self) -> None:
+        self.requested_pages = []
+
+        def get_html_from_page_num(obj, page):
+            self.requested_pages.append(page)
+            if page > 3:
+                return '<div class="no-results"></div>'
+            return "".join(f'<div class="infoWrap"><a href="/property/p{page}/{i}"></a></div>' for i in range(1, 4))
+
+        self.patches = [
+            mock.patch.object(ESPCCrawler, "get_html_from_page_num", get_html_from_page_num),
+            mock.patch.object(ESPCPropertyInfo, "init_from_url", staticmethod(init_from_url_offline)),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.obj = ESPCCrawler("edinburgh", "1plus", "210000", "flat,house", use_mp=False, cache_size=2)
+
+    def tearDown(self) -> None:
+        for patch in self.patches:
+            patch.stop()
+
+    def test__getitem__page_is_cached(self):
+        for i in range(1, 4):
+            self.assertEqual(f"https://espc.com/property/p2/{i}", self.obj[i, 2].url)
+        self.assertEqual([2], self.requested_pages)
+
+    def test_cache_eviction(self):
+        for page in [1, 2, 1, 3, 1, 2]:
+            self.obj.get_property_urls_on_page(page)
+        # Page 2 is the least recently used when page 3 is added
+        self.assertEqual([1, 2, 3, 2], self.requested_pages)
+
+    def test_truth_value_sends_no_request(self):
+        self.assertTrue(self.obj)
+        self.assertEqual([], self.requested_pages)
+
+    def test_property_count_and_index(self):
+        self.assertEqual(9, self.obj.property_count())
+        self.assertEqual([1, 2, 3, 4], self.requested_pages)
+        self.assertEqual(9, self.obj.property_count())
+        self.assertEqual([1, 2, 3, 4], self.requested_pages)
+
+        self.assertEqual("https://espc.com/property/p1/1", self.obj[0].url)
+        self.assertEqual("https://espc.com/property/p3/3", self.obj[-1].url)
+        self.assertEqual(["https://espc.com/property/p2/1", "https://espc.com/property/p2/3"],
+                         [property_info.url for property_info in self.obj[3:6:2]])
+        with self.assertRaises(IndexError):
+            self.obj[9]
+        self.assertEqual([1, 2, 3, 4], self.requested_pages)
+
+
 class TestESPCCrawler(unittest.TestCase):
     """
     This class represents the ESPCCrawler test case
@@ -78,6 +222,13 @@ class TestESPCCrawler(unittest.TestCase):
                 break  # Only test the first one
             break
 
+    def test_iter_property_infos(self):
+        for property_info in self.obj.iter_property_infos(max_in_flight=4):
+            for field in EXPECTED_PROPERTY_INFO_1.__dict__:
+                self.assertEqual(EXPECTED_PROPERTY_INFO_1.__getattribute__(field),
+                                 property_info.__getattribute__(field))
+            break  # Only test the first one
+
     def test__getitem__(self):
         for field in EXPECTED_PROPERTY_INFO_1.__dict__:
             self.assertEqual(EXPECTED_PROPERTY_INFO_1.__getattribute__(field),
@@ -1,13 +1,68 @@
+import json
+import os
+import tempfile
+import threading
 import unittest
-from SIMD import SIMDCrawler, SIMDInfoVariation
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from SIMD import SIMDCrawler, SIMDHTTPCrawler, SIMDInfoVariation, parse_simd_results, build_edge_options
+from browser_daemon import attach
+
+
+def make_simd_crawler(**kwargs) -> SIMDCrawler:
+    """
+    Attach to the browser daemon if SIMD_BROWSER_DAEMON is set to its state file (see browser_daemon.py), so that
+    test cases do not each launch a browser
+    """
+    state_path = os.environ.get("SIMD_BROWSER_DAEMON")
+    if state_path:
+        return attach(version=kwargs["version"], state_path=state_path)
+    return SIMDCrawler(**kwargs)
+
+# Sample responses for postcode EH9 1HF in the layout ASSUMED by SIMDHTTPCrawler, as served by the local stand-in.
+# They are not captured from simd.scot, so these tests only check the client against that assumed layout
+SAMPLE_RESPONSES = {
+    "/api/simd2020/postcode/EH9%201HF": {"datazoneid": "S01008616"},
+    "/api/simd2020/datazone/S01008616": {
+        "datazoneid": "S01008616",
+        "igname": "Marchmont East and Sciennes",
+        "domains": [
+            {"name": "Overall", "rank": 6843, "bar": 10},
+            {"name": "Income domain", "rank": 6530.5, "bar": 10},
+            {"name": "Employment domain", "rank": 6960, "bar": 10},
+            {"name": "Health domain", "rank": 6969, "bar": 10},
+            {"name": "Education/Skills domain", "rank": 5944, "bar": 9},
+            {"name": "Housing domain", "rank": 106, "bar": 1},
+            {"name": "Geographic access domain", "rank": 6819, "bar": 10},
+            {"name": "Crime domain", "rank": 5540, "bar": 8},
+        ]
+    },
+}
+
+
+class AssumedLayoutHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path not in SAMPLE_RESPONSES:
+            self.send_error(404)
+            return
+
+        body = json.dumps(SAMPLE_RESPONSES[self.path]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
 
 
 class TestSIMDInfoVariation(unittest.TestCase):
     def setUp(self) -> None:
-        self.obj = SIMDCrawler(use_headless=False, version=2020)
+        self.obj = make_simd_crawler(use_headless=False, version=2020)
 
     def tearDown(self) -> None:
-        self.obj.browser.close()  # Close the browser
+        self.obj.close()  # Close the browser, unless attached to the daemon
 
     def test_cal_variations(self):
         postcode = "EH9 1HF".lower()
@@ -23,13 +78,151 @@ class TestSIMDInfoVariation(unittest.TestCase):
         simd_variation.cal_variations(simd_infos)
 
 
+class TestParseSIMDResults(unittest.TestCase):
+    def test_parse_simd_results(self):
+        # As returned by READ_RESULTS_SCRIPT for postcode EH9 1HF in 2020
+        results = {
+            "data_zone_id": "S01008616\n",
+            "data_zone_name": " Marchmont East and Sciennes",
+            "components": [
+                {"caption": "Overall: 6843", "bar": "10"},
+                {"caption": "Income domain: 6530.5", "bar": " 10\n"},
+                {"caption": "Employment domain: 6960", "bar": "10"},
+                {"caption": "Health domain: 6969", "bar": "10"},
+                {"caption": "Education/Skills domain: 5944", "bar": "9"},
+                {"caption": "Housing domain: 106", "bar": "1"},
+                {"caption": "Geographic access domain: 6819", "bar": "10"},
+                {"caption": "Crime domain: 5540", "bar": "8"},
+            ]
+        }
+        simd_info = parse_simd_results(results, postcode="eh9 1hf", version=2020)
+
+        self.assertEqual("s01008616", simd_info.data_zone_id)
+        self.assertEqual("Marchmont East and Sciennes".lower(), simd_info.data_zone_name)
+        self.assertEqual("eh9 1hf", simd_info.postcode)
+        self.assertEqual(6843, simd_info.overall_rank)
+        self.assertEqual(10, simd_info.overall_rank_bar)
+        self.assertEqual(6530, simd_info.income_rank)
+        self.assertEqual(10, simd_info.income_rank_bar)
+        self.assertEqual(6960, simd_info.employment_rank)
+        self.assertEqual(6969, simd_info.health_rank)
+        self.assertEqual(5944, simd_info.edu_rank)
+        self.assertEqual(9, simd_info.edu_rank_bar)
+        self.assertEqual(106, simd_info.housing_rank)
+        self.assertEqual(1, simd_info.housing_rank_bar)
+        self.assertEqual(6819, simd_info.geo_access_rank)
+        self.assertEqual(5540, simd_info.crime_rank)
+        self.assertEqual(8, simd_info.crime_rank_bar)
+        self.assertEqual(2020, simd_info.version)
+
+    def test_parse_simd_results_missing_domain(self):
+        results = {"data_zone_id": "S01008616", "data_zone_name": "x",
+                   "components": [{"caption": "Overall: 6843", "bar": "10"}]}
+        simd_info = parse_simd_results(results, postcode="eh9 1hf", version=2020)
+
+        self.assertEqual(-1, simd_info.crime_rank)
+        self.assertEqual(-1, simd_info.crime_rank_bar)
+
+    def test_parse_simd_results_unknown_domain(self):
+        results = {"data_zone_id": "S01008616", "data_zone_name": "x",
+                   "components": [{"caption": "Access to services: 1", "bar": "1"}]}
+        with self.assertRaises(RuntimeError):
+            parse_simd_results(results, postcode="eh9 1hf", version=2020)
+
+    def test_parse_simd_results_not_rendered(self):
+        for results in ({"data_zone_id": "", "data_zone_name": "",
+                         "components": [{"caption": "Overall: 6843", "bar": "10"}]},
+                        {"data_zone_id": "S01008616", "data_zone_name": "x", "components": []}):
+            with self.assertRaises(RuntimeError):
+                parse_simd_results(results, postcode="eh9 1hf", version=2020)
+
+
+class TestBuildEdgeOptions(unittest.TestCase):
+    def test_lean(self):
+        capabilities = build_edge_options(use_headless=True, lean=True).to_capabilities()
+
+        self.assertEqual("eager", capabilities["pageLoadStrategy"])
+        self.assertEqual(2, capabilities["ms:edgeOptions"]["prefs"]["profile.managed_default_content_settings.images"])
+        self.assertIn("--headless", capabilities["ms:edgeOptions"]["args"])
+
+    def test_not_lean(self):
+        capabilities = build_edge_options(use_headless=False, lean=False).to_capabilities()
+
+        self.assertNotIn("pageLoadStrategy", capabilities)
+        self.assertNotIn("prefs", capabilities["ms:edgeOptions"])
+        self.assertNotIn("--headless", capabilities["ms:edgeOptions"]["args"])
+
+
+class TestAttach(unittest.TestCase):
+    def test_attach(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, "browser_daemon.json")
+            with open(state_path, "w") as f:
+                json.dump({"command_executor": "http://127.0.0.1:9515", "lean": True,
+                           "sessions": [{"session_id": "a", "w3c": True}, {"session_id": "b", "w3c": True}]}, f)
+            obj = attach(version=2016, session_index=1, state_path=state_path)
+
+        self.assertEqual("b", obj.browser.session_id)
+        self.assertEqual(2016, obj.version)
+        self.assertTrue(obj.lean)
+        with mock.patch.object(obj.browser, "quit") as quit_browser:
+            obj.close()
+        quit_browser.assert_not_called()  # The session belongs to the daemon
+
+
+class TestSIMDHTTPCrawler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), AssumedLayoutHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.obj = SIMDHTTPCrawler(f"http://127.0.0.1:{self.server.server_address[1]}", version=2020)
+
+    def tearDown(self) -> None:
+        self.obj.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_clear_and_search_2020(self):
+        postcode = "EH9 1HF".lower()
+        simd_info = self.obj.clear_and_search(postcode)
+
+        self.assertEqual("s01008616", simd_info.data_zone_id)
+        self.assertEqual("Marchmont East and Sciennes".lower(), simd_info.data_zone_name)
+        self.assertEqual("eh9 1hf", simd_info.postcode)
+        self.assertEqual(6843, simd_info.overall_rank)
+        self.assertEqual(10, simd_info.overall_rank_bar)
+        self.assertEqual(6530, simd_info.income_rank)
+        self.assertEqual(10, simd_info.income_rank_bar)
+        self.assertEqual(5944, simd_info.edu_rank)
+        self.assertEqual(9, simd_info.edu_rank_bar)
+        self.assertEqual(6819, simd_info.geo_access_rank)
+        self.assertEqual(10, simd_info.geo_access_rank_bar)
+        self.assertEqual(5540, simd_info.crime_rank)
+        self.assertEqual(8, simd_info.crime_rank_bar)
+        self.assertEqual(2020, simd_info.version)
+
+    def test_search_many(self):
+        simd_infos = self.obj.search_many(["eh9 1hf"] * 20)
+
+        self.assertEqual(20, simd_infos.__len__())
+        self.assertTrue(all(simd_info.overall_rank == 6843 for simd_info in simd_infos))
+
+    def test_version_is_keyword_only(self):
+        # The second positional argument of SIMDCrawler.clear_and_search is retry
+        with self.assertRaises(TypeError):
+            self.obj.clear_and_search("eh9 1hf", 2016)
+
+    def test_unknown_postcode_without_fallback(self):
+        with self.assertRaises(Exception):
+            self.obj.clear_and_search("eh1 1aa")
+
+
 """
 class TestSIMDCrawler(unittest.TestCase):
     def setUp(self) -> None:
         self.obj = SIMDCrawler(use_headless=True, version=2020)
 
     def tearDown(self) -> None:
-        self.obj.browser.close()  # Close the browser
+        self.obj.close()  # Close the browser
 
     def test_clear_and_search_2020(self):
         self.obj.update_version(2020)
@@ -0,0 +1,63 @@
+import http.server
+import subprocess
+import sys
+import threading
+import unittest
+from browser_daemon import wait_for_driver
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    ready = True
+
+    def do_GET(self):
+        body = ('{"value": {"ready": %s, "message": ""}}' % ("true" if self.ready else "false")).encode()
+        self.send_response(200 if self.path == "/status" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(body.__len__()))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWaitForDriver(unittest.TestCase):
+    def setUp(self) -> None:
+        # Stands in for msedgedriver, which keeps running
+        self.driver_process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+
+    def tearDown(self) -> None:
+        self.driver_process.terminate()
+        self.driver_process.wait()
+
+    def serve_status(self, ready: bool) -> str:
+        handler = type("Handler", (StatusHandler,), {"ready": ready})
+        server = http.server.HTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def test_ready(self):
+        wait_for_driver(self.serve_status(True), self.driver_process, timeout=5)
+
+    def test_not_ready(self):
+        with self.assertRaises(TimeoutError):
+            wait_for_driver(self.serve_status(False), self.driver_process, timeout=0.5)
+
+    def test_not_listening(self):
+        server = http.server.HTTPServer(("127.0.0.1", 0), StatusHandler)
+        command_executor = f"http://127.0.0.1:{server.server_address[1]}"
+        server.server_close()
+        with self.assertRaises(TimeoutError):
+            wait_for_driver(command_executor, self.driver_process, timeout=0.5)
+
+    def test_driver_exited(self):
+        self.driver_process.terminate()
+        self.driver_process.wait()
+        with self.assertRaises(RuntimeError):
+            wait_for_driver(self.serve_status(True), self.driver_process, timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import datetime
+import os
+import tempfile
+import unittest
+from ESPC import ESPCPropertyInfo
+from SIMD import SIMDInfo
+from pipeline import EnrichedPropertyInfo
+
+try:
+    import pyarrow as pa
+    from columnar import read_parquet, write_parquet
+except ImportError:
+    pa = None
+
+SEARCH = {"location": "edinburgh", "min_beds": "1plus", "max_price": "210000", "property_type": "flat,house"}
+
+
+def make_record(i: int) -> EnrichedPropertyInfo:
+    return EnrichedPropertyInfo(
+        property_info=ESPCPropertyInfo(price_type="offers over", price_val=130000 + i, title="flat", address="x",
+                                       postcode="eh11 2ej", bed_num=1, bath_num=1, couch_num=1, floor_area=43,
+                                       council_tax="B", epc="C" if i % 2 else "D", url=f"https://espc.com/p/{i}"),
+        simds={version: SIMDInfo(data_zone_id="s01008616", data_zone_name="dalry", postcode="eh11 2ej",
+                                 overall_rank=6843, overall_rank_bar=10 - i % 3, version=version)
+               for version in (2020, 2016, 2012)}
+    )
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestColumnar(unittest.TestCase):
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as root:
+            write_parquet((make_record(i) for i in range(5)), root, SEARCH, datetime.date(2026, 10, 18), batch_size=2)
+            write_parquet((make_record(i) for i in range(5, 8)), root, SEARCH, datetime.date(2026, 10, 19))
+
+            table = read_parquet(root)
+            self.assertEqual(8, table.num_rows)
+            self.assertEqual(pa.int32(), table.schema.field("price_val").type)
+            self.assertEqual(pa.int8(), table.schema.field("simd_2020_overall_rank_bar").type)
+            self.assertEqual(pa.int32(), table.schema.field("simd_2012_crime_rank").type)
+            self.assertTrue(pa.types.is_dictionary(table.schema.field("epc").type))
+            self.assertEqual({"edinburgh_1plus_210000_flat+house"}, set(table.column("search").to_pylist()))
+
+            table = read_parquet(root, columns=["url", "price_val"],
+                                 filters=[("crawl_date", ">=", "2026-10-19"), ("epc", "=", "C")])
+            self.assertEqual(["url", "price_val"], table.column_names)
+            self.assertEqual([130005, 130007], sorted(table.column("price_val").to_pylist()))
+
+    def test_write_again(self):
+        with tempfile.TemporaryDirectory() as root:
+            # e.g., a crawl saved when interrupted, then when resumed
+            write_parquet((make_record(i) for i in range(3)), root, SEARCH, datetime.date(2026, 10, 18))
+            path = write_parquet((make_record(i) for i in range(5)), root, SEARCH, datetime.date(2026, 10, 18))
+
+            self.assertEqual(["part-0.parquet"], os.listdir(os.path.dirname(path)))
+            self.assertEqual(5, read_parquet(root).num_rows)
+
+    def test_failed_write_keeps_previous_file(self):
+        def failing_records():
+            yield make_record(0)
+            raise RuntimeError("Interrupted")
+
+        with tempfile.TemporaryDirectory() as root:
+            path = write_parquet((make_record(i) for i in range(3)), root, SEARCH, datetime.date(2026, 10, 18))
+            with self.assertRaises(RuntimeError):
+                write_parquet(failing_records(), root, SEARCH, datetime.date(2026, 10, 18))
+
+            self.assertEqual(["part-0.parquet"], os.listdir(os.path.dirname(path)))
+            self.assertEqual(3, read_parquet(root).num_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
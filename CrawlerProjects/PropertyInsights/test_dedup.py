@@ -0,0 +1,110 @@
+import unittest
+from ESPC import ESPCPropertyInfo
+from dedup import (DuplicateDetector, address_words, fingerprint, normalise_address, normalise_postcode,
+                   similar_addresses, slug_of_url)
+
+URL = "https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521"
+
+
+def make_property_info(address: str, url: str, floor_area: int = 54, bed_num: int = 2, bath_num: int = 1,
+                       price_val: int = 200000) -> ESPCPropertyInfo:
+    return ESPCPropertyInfo(address=address, postcode=normalise_postcode(address), url=url, floor_area=floor_area,
+                            bed_num=bed_num, bath_num=bath_num, price_val=price_val)
+
+
+class TestNormalise(unittest.TestCase):
+    def test_normalise_postcode(self):
+        self.assertEqual("eh11 2ej", normalise_postcode("15 downfield place, edinburgh EH11 2EJ"))
+        self.assertEqual("eh11 2ej", normalise_postcode("eh112ej"))
+        self.assertEqual("eh11 2ej", normalise_postcode(slug_of_url(URL)))
+        self.assertEqual("", normalise_postcode("downfield place"))
+
+    def test_normalise_address(self):
+        expected = ("15", "3f4", "downfield", "edinburgh", "place")
+        self.assertEqual(expected, normalise_address("15 (3F4) Downfield Place, Edinburgh, EH11 2EJ"))
+        self.assertEqual(expected, normalise_address("Flat 3/4, 15 Downfield Pl., Edinburgh EH11 2EJ"))
+        self.assertEqual(expected, normalise_address(slug_of_url(URL + "?utm_source=advert")))
+
+    def test_address_words(self):
+        self.assertEqual(("1", "12", "main", "street"), address_words("flat-1-12-main-street-eh1-1aa"))
+        self.assertEqual(("12", "1", "main", "street"), address_words("Flat 12, 1 Main St, EH1 1AA"))
+
+    def test_slug_of_url(self):
+        self.assertEqual("15-3f4-downfield-place-edinburgh-eh11-2ej", slug_of_url(URL))
+        self.assertEqual("", slug_of_url("https://espc.com/properties"))
+
+    def test_similar_addresses(self):
+        address = normalise_address("15 (3f4) downfield place, edinburgh")
+        self.assertTrue(similar_addresses(address, normalise_address("15 (3f4) downfeild place, edinburgh")))
+        self.assertTrue(similar_addresses(address, normalise_address("15 (3f4) downfield place")))
+        # Neighbouring flat
+        self.assertFalse(similar_addresses(address, normalise_address("15 (3f3) downfield place, edinburgh")))
+        self.assertFalse(similar_addresses(address, normalise_address("15 (3f4) dalry road, edinburgh")))
+
+    def test_fingerprint(self):
+        property_info = make_property_info("15 (3f4) downfield place, edinburgh eh11 2ej", URL)
+        relisted = make_property_info("Flat 3/4, 15 Downfield Pl, Edinburgh EH11 2EJ",
+                                      "https://espc.com/property/flat-3-4-15-downfield-pl/36200000", price_val=190000)
+        self.assertEqual(fingerprint(property_info), fingerprint(relisted))
+        self.assertNotEqual(fingerprint(property_info),
+                            fingerprint(make_property_info("15 (3f4) downfield place, edinburgh eh11 2ej", URL,
+                                                           bed_num=3)))
+
+
+class TestDuplicateDetector(unittest.TestCase):
+    def setUp(self) -> None:
+        self.obj = DuplicateDetector()
+        self.assertIsNone(self.obj.add(make_property_info("15 (3f4) downfield place, edinburgh eh11 2ej", URL)))
+
+    def test_add(self):
+        # Same property by another agent, with a typo
+        self.assertEqual(URL, self.obj.add(make_property_info(
+            "15 (3f4) downfeild place, edinburgh eh11 2ej", "https://espc.com/property/other-agent/36200000")))
+        # Same address, but a different floor area
+        self.assertIsNone(self.obj.add(make_property_info(
+            "15 (3f4) downfield place, edinburgh eh11 2ej", "https://espc.com/property/extended/36200001",
+            floor_area=70)))
+        # Neighbouring flat
+        self.assertIsNone(self.obj.add(make_property_info(
+            "15 (3f3) downfield place, edinburgh eh11 2ej", "https://espc.com/property/neighbour/36200002")))
+        self.assertEqual(3, self.obj.__len__())
+        # Added again, e.g., when the crawl is resumed
+        self.assertIsNone(self.obj.add(make_property_info("15 (3f4) downfield place, edinburgh eh11 2ej", URL)))
+        self.assertEqual(3, self.obj.__len__())
+
+    def test_find_url(self):
+        self.assertEqual(URL, self.obj.find_url("https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej"
+                                                "/36300000"))
+        self.assertIsNone(self.obj.find_url(URL))
+        self.assertIsNone(self.obj.find_url("https://espc.com/property/15-3f3-downfield-place-edinburgh-eh11-2ej"
+                                            "/36300001"))
+        self.assertIsNone(self.obj.find_url("https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ek"
+                                            "/36300002"))
+
+    def test_find_url_other_unit(self):
+        # Units of the same building, told apart by their details only
+        self.obj.add(make_property_info("two bed, embankment west 5 elfin square, eh11 3af",
+                                        "https://espc.com/property/two-bed-embankment-west-5-elfin-square-eh11-3af"
+                                        "/35784393"))
+        for unit in ("one", "three"):
+            self.assertIsNone(self.obj.find_url(f"https://espc.com/property/{unit}-bed-embankment-west-5-elfin-square"
+                                                f"-eh11-3af/3578440{unit.__len__()}"))
+        self.assertEqual("https://espc.com/property/two-bed-embankment-west-5-elfin-square-eh11-3af/35784393",
+                         self.obj.find_url("https://espc.com/property/two-bed-embankment-west-5-elfin-sq-eh11-3af"
+                                           "/35784410"))
+
+    def test_find_url_number_order(self):
+        self.obj.add(make_property_info("flat 1/12, main street, eh1 1aa",
+                                        "https://espc.com/property/flat-1-12-main-street-eh1-1aa/36300005"))
+        self.assertIsNone(self.obj.find_url("https://espc.com/property/flat-12-1-main-street-eh1-1aa/36300006"))
+        self.assertEqual("https://espc.com/property/flat-1-12-main-street-eh1-1aa/36300005",
+                         self.obj.find_url("https://espc.com/property/1-12-main-street-eh1-1aa/36300007"))
+
+    def test_find_url_without_number(self):
+        self.obj.add(make_property_info("downfield place, edinburgh eh11 2ej",
+                                        "https://espc.com/property/downfield-place-edinburgh-eh11-2ej/36300003"))
+        self.assertIsNone(self.obj.find_url("https://espc.com/property/downfield-place-edinburgh-eh11-2ej/36300004"))
+
+
+if __name__ == "__main__":
+    unittest.main()
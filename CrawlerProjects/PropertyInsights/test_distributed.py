@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ESPC import ESPCCrawler, ESPCPropertyInfo
+from SIMD import SIMDInfo
+from distributed import DEFAULT_SEARCH, Worker, enqueue_searches
+from work_queue import WorkQueue
+
+LAST_PAGE = 7
+
+
+def get_property_urls_on_page(obj, page):
+    if page > LAST_PAGE:
+        return []
+    # The first property is advertised on every page
+    return ["https://espc.com/property/ad/1?ad=1", f"https://espc.com/property/p{page}/{page + 1}"]
+
+
+def init_from_url_offline(url):
+    return ESPCPropertyInfo(url=url, postcode="eh9 1hf")
+
+
+class StubSIMDCrawler:
+    def __init__(self, on_search=None):
+        self.version = 2020
+        self.on_search = on_search
+
+    def update_version(self, version):
+        self.version = version
+
+    def clear_and_search(self, postcode, retry=1):
+        if self.on_search is not None:
+            self.on_search()
+        return SIMDInfo(postcode=postcode, overall_rank_bar=8, version=self.version)
+
+    def close(self):
+        pass
+
+
+class TestDistributed(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.dir.name, "queue.sqlite3"))
+        self.patches = [
+            mock.patch.object(ESPCCrawler, "get_property_urls_on_page", get_property_urls_on_page),
+            mock.patch.object(ESPCPropertyInfo, "init_from_url", staticmethod(init_from_url_offline)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self) -> None:
+        for patch in self.patches:
+            patch.stop()
+        self.queue.close()
+        self.dir.cleanup()
+
+    def pages_shards(self):
+        return [(payload["start"], payload["end"], payload["last"]) for payload, result in
+                self.queue.iter_results("pages")]
+
+    def test_enqueue_searches(self):
+        enqueue_searches(self.queue, [DEFAULT_SEARCH], max_pages=5, pages_per_shard=2)
+        enqueue_searches(self.queue, [DEFAULT_SEARCH], max_pages=5, pages_per_shard=2)  # Enqueued only once
+        shards = []
+        while True:
+            shard = self.queue.claim("worker-1")
+            if shard is None:
+                break
+            shards.append((shard.payload["start"], shard.payload["end"], shard.payload["last"]))
+
+        self.assertEqual([(1, 2, False), (3, 4, False), (5, 5, True)], shards)
+
+    def test_worker_extends_plan_and_skips_duplicates(self):
+        enqueue_searches(self.queue, [DEFAULT_SEARCH], max_pages=4, pages_per_shard=2)
+        Worker(self.queue, simd_crawler_factory=StubSIMDCrawler).run(poll_seconds=0)
+
+        # Pages 5 to 8 are planned by the workers, page 8 is beyond the last page
+        self.assertEqual([(1, 2, False), (3, 4, True), (5, 6, True), (7, 8, True)], self.pages_shards())
+        urls = [payload["url"] for payload, result in self.queue.iter_results("property")]
+        self.assertEqual(1 + LAST_PAGE, urls.__len__())
+        self.assertEqual("https://espc.com/property/ad/1", urls[0])
+        self.assertEqual({"done": 4 + 1 + LAST_PAGE}, self.queue.counts())
+
+    def test_lease_lost_while_processing_property(self):
+        self.queue.put("property", {"url": "https://espc.com/property/p1/2", "search": DEFAULT_SEARCH})
+
+        def expire_and_reassign():
+            # The lease expires during the SIMD lookup and another worker claims the shard
+            self.queue.connection.execute("UPDATE shards SET lease_expires = 0")
+            self.assertIsNotNone(self.queue.claim("worker-2"))
+
+        worker = Worker(self.queue, worker_id="worker-1",
+                        simd_crawler_factory=lambda: StubSIMDCrawler(expire_and_reassign))
+        worker.process(self.queue.claim("worker-1"))
+
+        # worker-1 neither completes nor gives back the shard now held by worker-2
+        self.assertEqual({"leased": 1}, self.queue.counts())
+        self.assertEqual(("worker-2", 2), self.queue.connection.execute("SELECT owner, attempts FROM shards").fetchone())
+
+
+if __name__ == "__main__":
+    unittest.main()
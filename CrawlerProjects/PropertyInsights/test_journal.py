@@ -0,0 +1,95 @@
+import datetime
+import os
+import tempfile
+import unittest
+from journal import CrawlJournal
+
+STAGES = ("detail", "simd_2020")
+
+
+class TestCrawlJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "journal.sqlite3")
+        self.obj = CrawlJournal(self.path, STAGES)
+
+    def tearDown(self) -> None:
+        self.obj.close()
+        self.dir.cleanup()
+
+    def test_add_page_skips_duplicates(self):
+        self.assertEqual(["a", "b"], self.obj.add_page(1, ["a", "b"]))
+        self.assertEqual(["c"], self.obj.add_page(2, ["b", "c"]))
+
+    def test_next_page(self):
+        self.assertEqual(1, self.obj.next_page())
+        self.obj.add_page(1, ["a"])
+        self.obj.mark_page_done(1)
+        self.obj.add_page(2, ["b"])  # Discovered but interrupted
+        self.assertEqual(2, self.obj.next_page())
+
+    def test_resume(self):
+        self.obj.add_page(1, ["a", "b", "c"])
+        self.obj.record_done("a", "detail", {"postcode": "eh9 1hf"})
+        self.obj.record_done("a", "simd_2020", {"overall_rank_bar": 10})
+        self.obj.record_done("b", "detail", {"postcode": "eh11 2ej"})
+        self.obj.record_failure("b", "simd_2020", RuntimeError("browser crashed"))
+        self.obj.mark_finished()
+        self.obj.close()
+
+        # As if the crawl is restarted
+        self.obj = CrawlJournal(self.path, STAGES)
+        self.assertTrue(self.obj.is_finished())
+        self.assertEqual(["b", "c"], self.obj.unresolved_urls())
+        self.assertEqual({"postcode": "eh11 2ej"}, self.obj.get_result("b", "detail"))
+        self.assertIsNone(self.obj.get_result("b", "simd_2020"))
+        self.assertEqual([("a", {"detail": {"postcode": "eh9 1hf"}, "simd_2020": {"overall_rank_bar": 10}})],
+                         list(self.obj.iter_resolved()))
+        self.assertEqual([("b", "simd_2020", "RuntimeError('browser crashed')")], self.obj.failures())
+
+        # The retry succeeds
+        self.obj.record_done("b", "simd_2020", {"overall_rank_bar": 8})
+        self.assertEqual([], self.obj.failures())
+        self.assertEqual(["c"], self.obj.unresolved_urls())
+
+    def test_iter_results(self):
+        self.obj.add_page(1, ["a", "b", "c"])
+        self.obj.record_done("b", "detail", {"postcode": "eh11 2ej"})
+        self.obj.record_done("a", "detail", {"postcode": "eh9 1hf"})
+        self.obj.record_failure("c", "detail", RuntimeError("timeout"))
+        self.assertEqual([("a", {"postcode": "eh9 1hf"}), ("b", {"postcode": "eh11 2ej"})],
+                         list(self.obj.iter_results("detail")))
+
+    def test_duplicates(self):
+        self.obj.add_page(1, ["a", "b", "c"])
+        self.obj.record_done("a", "detail", {"postcode": "eh9 1hf"})
+        self.obj.record_done("a", "simd_2020", {"overall_rank_bar": 10})
+        self.obj.mark_duplicate("b", "a")
+        self.assertEqual(["c"], self.obj.unresolved_urls())
+        self.assertEqual(["a"], [url for url, results in self.obj.iter_resolved()])
+        self.assertEqual([("b", "a")], self.obj.duplicates())
+
+        self.obj.reset()
+        self.assertEqual([], self.obj.duplicates())
+
+    def test_reset(self):
+        self.obj.add_page(1, ["a"])
+        self.obj.mark_finished()
+        self.obj.reset()
+        self.assertFalse(self.obj.is_finished())
+        self.assertEqual([], self.obj.unresolved_urls())
+
+    def test_started_at(self):
+        started_at = self.obj.started_at()
+        self.obj.connection.execute("UPDATE meta SET value = '2026-10-18T23:59:00' WHERE key = 'started'")
+        # Kept when the crawl is resumed
+        self.obj.close()
+        self.obj = CrawlJournal(self.path, STAGES)
+        self.assertEqual(datetime.datetime(2026, 10, 18, 23, 59), self.obj.started_at())
+
+        self.obj.reset()
+        self.assertGreaterEqual(self.obj.started_at(), started_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from ESPC import ESPCPropertyInfo
+from SIMD import SIMDInfo
+from pipeline import EnrichedPropertyInfo, iter_enriched
+
+
+class StubESPCCrawler:
+    """
+    Yields the given properties as ESPCCrawler.iter_property_infos does, counting how many have been produced
+    """
+
+    def __init__(self, property_infos):
+        self.property_infos = property_infos
+        self.produced = 0
+
+    def iter_property_infos(self, max_in_flight=None, on_error=None):
+        for property_info in self.property_infos:
+            self.produced += 1
+            yield property_info
+
+
+class StubSIMDCrawler:
+    def __init__(self, failed_postcodes=()):
+        self.version = 2020
+        self.failed_postcodes = set(failed_postcodes)
+
+    def update_version(self, version):
+        self.version = version
+
+    def clear_and_search(self, postcode, retry=1):
+        if postcode in self.failed_postcodes and self.version == 2016:
+            raise RuntimeError("browser crashed")
+        return SIMDInfo(postcode=postcode, overall_rank_bar=self.version % 10, version=self.version)
+
+
+class TestEnrichedPropertyInfo(unittest.TestCase):
+    def test_to_row(self):
+        obj = EnrichedPropertyInfo(
+            property_info=ESPCPropertyInfo(price_val=130000, postcode="eh11 2ej", url="a"),
+            simds={2020: SIMDInfo(postcode="eh11 2ej", overall_rank_bar=7, version=2020),
+                   2016: SIMDInfo(postcode="eh11 2ej", overall_rank_bar=6, version=2016)}
+        )
+        row = obj.to_row()
+
+        self.assertEqual(list(ESPCPropertyInfo().__dict__), list(row)[:12])
+        self.assertEqual(130000, row["price_val"])
+        self.assertEqual(7, row["simd_2020_overall_rank_bar"])
+        self.assertEqual(6, row["simd_2016_overall_rank_bar"])
+        self.assertIn("simd_2016_data_zone_id", row)
+        self.assertNotIn("simd_2020_postcode", row)
+        self.assertNotIn("simd_2020_version", row)
+        self.assertEqual(12 + 2 * 18, row.__len__())
+
+
+class TestIterEnriched(unittest.TestCase):
+    def test_iter_enriched(self):
+        espc_crawler = StubESPCCrawler([
+            ESPCPropertyInfo(url="a", postcode="eh1 1aa"),
+            ESPCPropertyInfo(url="b", postcode="eh2 2bb"),
+            ESPCPropertyInfo(url="a", postcode="eh1 1aa"),  # Duplication due to advertisement
+            ESPCPropertyInfo(url="c", postcode="eh3 3cc"),
+        ])
+        errors = []
+        records = iter_enriched(espc_crawler, versions=(2020, 2016), simd_crawler=StubSIMDCrawler({"eh2 2bb"}),
+                                on_error=lambda url, stage, error: errors.append((url, stage)))
+
+        urls = []
+        for record in records:
+            # Properties are pulled one at a time, nothing is buffered ahead of the consumer
+            self.assertEqual({"a": 1, "c": 4}[record.property_info.url], espc_crawler.produced)
+            self.assertEqual([2020, 2016], list(record.simds))
+            urls.append(record.property_info.url)
+
+        self.assertEqual(["a", "c"], urls)
+        self.assertEqual([("b", "simd_2016")], errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
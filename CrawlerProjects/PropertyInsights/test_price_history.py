@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from ESPC import ESPCPropertyInfo
+from price_history import PriceHistoryStore, listing_id_from_url, LISTED, DELISTED
+
+DAY = 24 * 3600
+URL_A = "https://espc.com/property/15-3f4-downfield-place-edinburgh-eh11-2ej/36101521"
+URL_B = "https://espc.com/property/39-3f1-morningside-road-edinburgh-eh10-4df/36130009"
+
+
+def make_property_info(url: str, price_val: int, price_type: str = "offers over") -> ESPCPropertyInfo:
+    return ESPCPropertyInfo(url=url, price_val=price_val, price_type=price_type)
+
+
+class TestListingIdFromUrl(unittest.TestCase):
+    def test_listing_id_from_url(self):
+        self.assertEqual(36101521, listing_id_from_url(URL_A))
+        self.assertEqual(36101521, listing_id_from_url(URL_A + "?utm_source=advert"))
+
+    def test_no_id(self):
+        with self.assertRaises(ValueError):
+            listing_id_from_url("https://espc.com/properties")
+
+
+class TestPriceHistoryStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "price_history.sqlite3")
+        self.obj = PriceHistoryStore(self.path)
+
+    def tearDown(self) -> None:
+        self.obj.close()
+        self.dir.cleanup()
+
+    def test_only_changes_recorded(self):
+        self.assertEqual(2, self.obj.record([make_property_info(URL_A, 200000), make_property_info(URL_B, 150000)],
+                                            observed_at=0))
+        self.assertEqual(0, self.obj.record([make_property_info(URL_A, 200000), make_property_info(URL_B, 150000)],
+                                            observed_at=DAY))
+        self.assertEqual(1, self.obj.record([make_property_info(URL_A, 195000), make_property_info(URL_B, 150000)],
+                                            observed_at=2 * DAY))
+        self.assertEqual(1, self.obj.record([make_property_info(URL_A, 195000, "fixed price"),
+                                             make_property_info(URL_B, 150000)], observed_at=3 * DAY))
+
+        history = self.obj.history(URL_A)
+        self.assertEqual([0, 2 * DAY, 3 * DAY], [change.observed_at for change in history])
+        self.assertEqual([None, 200000, 195000], [change.prev_price for change in history])
+        self.assertEqual([200000, 195000, 195000], [change.price for change in history])
+        self.assertEqual("fixed price", history[-1].price_type)
+        self.assertEqual("offers over", history[-1].prev_price_type)
+        self.assertEqual(1, self.obj.history(36130009).__len__())
+
+    def test_delisted_and_relisted(self):
+        self.obj.record([make_property_info(URL_A, 200000), make_property_info(URL_B, 150000)], observed_at=0)
+        # An incomplete crawl does not delist
+        self.assertEqual(0, self.obj.record([make_property_info(URL_A, 200000)], observed_at=DAY))
+        # Nor do the urls whose details are unknown
+        self.assertEqual(0, self.obj.record([make_property_info(URL_A, 200000)], observed_at=2 * DAY,
+                                            mark_missing=True, listed_urls=[URL_B]))
+        self.assertEqual(1, self.obj.record([make_property_info(URL_A, 200000)], observed_at=3 * DAY,
+                                            mark_missing=True))
+        self.assertEqual(1, self.obj.record([make_property_info(URL_A, 200000), make_property_info(URL_B, 150000)],
+                                            observed_at=4 * DAY, mark_missing=True))
+
+        self.assertEqual([(None, LISTED), (LISTED, DELISTED), (DELISTED, LISTED)],
+                         [(change.prev_status, change.status) for change in self.obj.history(URL_B)])
+
+    def test_price_drops(self):
+        self.obj.record([make_property_info(URL_A, 220000), make_property_info(URL_B, 150000)], observed_at=0)
+        self.obj.record([make_property_info(URL_A, 199000), make_property_info(URL_B, 160000)], observed_at=DAY)
+        self.obj.record([make_property_info(URL_A, 199000), make_property_info(URL_B, 145000)], observed_at=10 * DAY)
+
+        drops = self.obj.price_drops(days=7, max_price=200000, now=10 * DAY)
+        self.assertEqual([(URL_B, 160000, 145000)], [(drop.url, drop.prev_price, drop.price) for drop in drops])
+
+        drops = self.obj.price_drops(days=30, max_price=200000, now=10 * DAY)
+        self.assertEqual([URL_B, URL_A], [drop.url for drop in drops])
+        self.assertEqual([], self.obj.price_drops(days=30, max_price=145000, now=10 * DAY))
+
+    def test_persisted(self):
+        self.obj.record([make_property_info(URL_A, 200000)], observed_at=0)
+        self.obj.record([make_property_info(URL_A, 190000)], observed_at=DAY)
+        self.obj.close()
+
+        self.obj = PriceHistoryStore(self.path)
+        self.assertEqual(1, self.obj.price_drops(days=7, now=DAY).__len__())
+
+
+if __name__ == "__main__":
+    unittest.main()
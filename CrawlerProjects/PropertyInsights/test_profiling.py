@@ -0,0 +1,99 @@
+import glob
+import multiprocessing as mp
+import os
+import pstats
+import sys
+import tempfile
+import time
+import unittest
+import profiling
+
+
+def parse_page(n):
+    return sum(i * i for i in range(n))
+
+
+def wait_for_browser():
+    time.sleep(0.2)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        if profiling.is_enabled():
+            profiling.finish()
+        self.dir.cleanup()
+
+    def run_pool(self, mode):
+        expected = [parse_page(200000)] * 4
+        run_directory = profiling.start(mode, self.dir.name)
+        pool = mp.Pool(2, initializer=profiling.init_worker)
+        self.assertEqual(expected, pool.map(parse_page, [200000] * 4))
+        pool.close()
+        pool.join()
+        return run_directory, profiling.finish()
+
+    def test_cprofile(self):
+        run_directory, report_path = self.run_pool("cprofile")
+
+        self.assertFalse(profiling.is_enabled())
+        # The parent and the 2 workers
+        self.assertEqual(3, glob.glob(os.path.join(run_directory, "*-*.prof")).__len__())
+        stats = pstats.Stats(os.path.join(run_directory, "merged.prof"))
+        # Only called in the workers
+        calls = [stat[1] for func, stat in stats.stats.items() if func[2] == "parse_page"]
+        self.assertEqual([4], calls)
+        with open(report_path) as f:
+            self.assertIn("parse_page", f.read())
+
+    def test_sample(self):
+        run_directory, report_path = self.run_pool("sample")
+
+        with open(os.path.join(run_directory, "merged.folded")) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any("PoolWorker;" in line and "parse_page" in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        with open(report_path) as f:
+            self.assertIn("Self samples", f.read())
+
+    @unittest.skipIf(sys.platform == "win32", "pool.terminate does not send SIGTERM on Windows")
+    def test_terminated_worker(self):
+        run_directory = profiling.start("cprofile", self.dir.name)
+        pool = mp.Pool(1, initializer=profiling.init_worker)
+        pool.apply_async(parse_page, (200000,)).get()
+        pool.terminate()
+        pool.join()
+        profiling.finish()
+
+        self.assertEqual(1, glob.glob(os.path.join(run_directory, "*PoolWorker*.prof")).__len__())
+
+    def test_sampling_profiler(self):
+        obj = profiling.SamplingProfiler(interval=0.01)
+        obj.start()
+        wait_for_browser()
+        obj.stop()
+
+        stacks = [stack for stack in obj.stacks if "wait_for_browser" in stack]
+        self.assertTrue(stacks)
+        self.assertTrue(stacks[0].startswith("MainProcess;"))
+
+    def test_memory_snapshots(self):
+        # Does nothing unless profiling
+        with profiling.memory_snapshots("build"):
+            data = [str(i) for i in range(1000)]
+        self.assertEqual(1000, data.__len__())
+
+        run_directory = profiling.start("sample", self.dir.name)
+        with profiling.memory_snapshots("build"):
+            data = [str(i) for i in range(100000)]
+        with open(os.path.join(run_directory, "build-tracemalloc.txt")) as f:
+            self.assertIn("Peak traced memory in build", f.read())
+        self.assertTrue(os.path.exists(os.path.join(run_directory, "build-after.tracemalloc")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import random
+import unittest
+from ESPC import ESPCPropertyInfo
+from SIMD import SIMDInfo
+from pipeline import EnrichedPropertyInfo
+from query import PropertyIndex, SortedIndex, iter_bitmap, to_bitmap
+
+VERSIONS = (2020, 2016)
+
+
+def make_records(num: int, seed: int = 0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(num):
+        property_info = ESPCPropertyInfo(
+            price_type=rng.choice(["offers over", "fixed price"]),
+            price_val=rng.randint(50, 300) * 1000,
+            bed_num=rng.randint(1, 4),
+            floor_area=rng.choice([-1, rng.randint(30, 150)]),
+            epc=rng.choice("ABCDEFG"),
+            url=f"https://espc.com/property/{i}",
+        )
+        simds = {version: SIMDInfo(data_zone_id=f"S0{rng.randint(0, 99)}", overall_rank=rng.randint(1, 6976),
+                                   overall_rank_bar=rng.randint(1, 10), version=version) for version in VERSIONS}
+        records.append(EnrichedPropertyInfo(property_info=property_info, simds=simds))
+
+    return records
+
+
+class TestBitmap(unittest.TestCase):
+    def test_round_trip(self):
+        ids = [0, 3, 8, 9, 63, 64, 99]
+        self.assertEqual(ids, list(iter_bitmap(to_bitmap(ids, 100), 100)))
+        self.assertEqual([], list(iter_bitmap(0, 100)))
+
+    def test_sorted_index(self):
+        values = [5, 1, 3, 3, 9, 7, 1, 0, 3]
+        obj = SortedIndex(values, bucket_num=3)
+        for low, high in [(None, None), (1, 3), (3, 3), (2, 2), (4, None), (None, 0), (8, 100), (9, 1)]:
+            expected = [i for i, value in enumerate(values)
+                        if (low is None or value >= low) and (high is None or value <= high)]
+            self.assertEqual(expected, list(iter_bitmap(obj.bitmap(low, high), values.__len__())), (low, high))
+
+
+class TestPropertyIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.records = make_records(500)
+        self.obj = PropertyIndex(self.records, versions=VERSIONS, bucket_num=16)
+
+    def assert_query(self, predicate, **predicates):
+        self.assertEqual([record.property_info.url for record in self.records if predicate(record.to_row())],
+                         [record.property_info.url for record in self.obj.query(**predicates)])
+
+    def test_query(self):
+        self.assert_query(lambda row: row["price_val"] <= 200000 and row["bed_num"] >= 2 and row["epc"] in "ABC",
+                          price_val=(None, 200000), bed_num=(2, None), epc={"A", "B", "C"})
+        self.assert_query(lambda row: row["floor_area"] >= 0 and row["simd_2020_overall_rank_bar"] == 8,
+                          floor_area=(0, None), simd_2020_overall_rank_bar=8)
+        self.assert_query(lambda row: row["epc"] <= "C" and row["price_type"] == "fixed price",
+                          epc=("A", "C"), price_type="fixed price")
+        self.assert_query(lambda row: row["price_val"] in {100000, 150000}, price_val=[100000, 150000])
+        self.assert_query(lambda row: False, price_val=(300001, None))
+        self.assert_query(lambda row: True)
+
+    def test_high_cardinality_category(self):
+        self.assertIn("simd_2020_data_zone_id", self.obj.sorted_indexes)
+        self.assertIn("epc", self.obj.bitmaps)
+        self.assert_query(lambda row: row["simd_2020_data_zone_id"] == "S042", simd_2020_data_zone_id="S042")
+
+    def test_top_k(self):
+        bars = {f"simd_{version}_overall_rank_bar": (8, None) for version in VERSIONS}
+        matched = [record for record in self.records
+                   if all(record.simds[version].overall_rank_bar >= 8 for version in VERSIONS)]
+        cheapest = sorted(matched, key=lambda record: record.property_info.price_val)[:5]
+
+        results = self.obj.top_k(5, "price_val", **bars)
+        self.assertEqual([record.property_info.price_val for record in cheapest],
+                         [record.property_info.price_val for record in results])
+        self.assertTrue(all(record in matched for record in results))
+
+        results = self.obj.top_k(3, "price_val", descending=True, epc="A")
+        self.assertEqual(sorted((record.property_info.price_val for record in self.records
+                                 if record.property_info.epc == "A"), reverse=True)[:3],
+                         [record.property_info.price_val for record in results])
+
+    def test_not_indexed(self):
+        with self.assertRaises(ValueError):
+            self.obj.query(title="flat")
+        with self.assertRaises(ValueError):
+            self.obj.top_k(5, "epc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import unittest
+from work_queue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "queue.sqlite3")
+        self.obj = WorkQueue(self.path, max_attempts=2)
+
+    def tearDown(self) -> None:
+        self.obj.close()
+        self.dir.cleanup()
+
+    def test_put_with_key(self):
+        self.assertTrue(self.obj.put("property", {"url": "a"}, key="a"))
+        self.assertFalse(self.obj.put("property", {"url": "a"}, key="a"))
+        self.assertEqual({"pending": 1}, self.obj.counts())
+
+    def test_claim_and_complete(self):
+        self.obj.put("property", {"url": "a"})
+        self.obj.put("property", {"url": "b"})
+        # Another worker on the same file
+        other = WorkQueue(self.path)
+        shard_1 = self.obj.claim("worker-1")
+        shard_2 = other.claim("worker-2")
+        self.assertEqual({"url": "a"}, shard_1.payload)
+        self.assertEqual({"url": "b"}, shard_2.payload)
+        self.assertIsNone(self.obj.claim("worker-1"))
+
+        self.assertTrue(self.obj.complete(shard_1, {"price_val": 1}))
+        self.assertTrue(other.complete(shard_2, {"price_val": 2}))
+        other.close()
+        self.assertTrue(self.obj.is_drained())
+        self.assertEqual([({"url": "a"}, {"price_val": 1}), ({"url": "b"}, {"price_val": 2})],
+                         list(self.obj.iter_results("property")))
+
+    def test_expired_lease_is_reassigned(self):
+        self.obj.put("property", {"url": "a"})
+        crashed = self.obj.claim("worker-1", lease_seconds=0.01)
+        time.sleep(0.02)
+        shard = self.obj.claim("worker-2")
+        self.assertEqual("worker-2", shard.owner)
+        self.assertEqual(2, shard.attempts)
+        # The crashed worker comes back too late
+        self.assertFalse(self.obj.renew(crashed))
+        self.assertFalse(self.obj.complete(crashed, {}))
+        self.assertTrue(self.obj.complete(shard, {}))
+
+    def test_fail_until_max_attempts(self):
+        self.obj.put("property", {"url": "a"})
+        self.obj.fail(self.obj.claim("worker-1"), RuntimeError("browser crashed"))
+        self.assertEqual({"pending": 1}, self.obj.counts())
+        self.obj.fail(self.obj.claim("worker-1"), RuntimeError("browser crashed"))
+        self.assertEqual({"failed": 1}, self.obj.counts())
+        self.assertIsNone(self.obj.claim("worker-1"))
+        self.assertEqual([("property", {"url": "a"}, "RuntimeError('browser crashed')")],
+                         list(self.obj.iter_failures()))
+
+
+if __name__ == "__main__":
+    unittest.main()
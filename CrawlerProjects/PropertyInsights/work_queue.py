@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class Shard:
+    """
+    A unit of work claimed from a WorkQueue
+    """
+
+    def __init__(self, *, shard_id: int, kind: str, payload: dict, owner: str, attempts: int):
+        """
+        Constructor
+        :param shard_id: id of the shard in the queue
+        :param kind: Kind of the shard, e.g., "pages" or "property"
+        :param payload: The JSON payload describing the work
+        :param owner: id of the worker holding the lease
+        :param attempts: Number of times the shard has been claimed, including this one
+        """
+        self.shard_id = shard_id  # type: int
+        self.kind = kind  # type: str
+        self.payload = payload  # type: dict
+        self.owner = owner  # type: str
+        self.attempts = attempts  # type: int
+
+    def __repr__(self) -> str:
+        return f"Shard {self.shard_id} ({self.kind}) leased by {self.owner}"
+
+
+class WorkQueue:
+    """
+    A work queue shared by several worker processes (possibly on several nodes) through a SQLite file.
+    A worker claims a shard with a lease; if the worker crashes, the lease expires and the shard is claimed again.
+    When the file is on NFS, the locking of the NFS server must be reliable, and the rollback journal is used
+    because WAL does not work over a network file system
+    """
+
+    def __init__(self, path: str = "./queue.sqlite3", max_attempts: int = 5, timeout: float = 60):
+        """
+        Constructor
+        :param path: Path to the SQLite file
+        :param max_attempts: A shard claimed this many times without being completed is marked as failed
+        :param timeout: Seconds to wait for the lock held by another worker
+        """
+        self.path = path  # type: str
+        self.max_attempts = max_attempts  # type: int
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                key TEXT UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS shards_status ON shards (status, lease_expires);
+        """)
+
+    def __repr__(self) -> str:
+        return f"Work queue at {self.path}"
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def put(self, kind: str, payload: dict, key: str = None) -> bool:
+        """
+        Add a shard to the queue
+        :param kind: Kind of the shard
+        :param payload: JSON serialisable description of the work
+        :param key: Optional unique key, a shard whose key is already in the queue is not added again
+        :return Whether the shard is added
+        """
+        cursor = self.connection.execute("INSERT OR IGNORE INTO shards (kind, key, payload) VALUES (?, ?, ?)",
+                                         (kind, key, json.dumps(payload)))
+
+        return cursor.rowcount == 1
+
+    def claim(self, owner: str, lease_seconds: float = 300) -> Optional[Shard]:
+        """
+        Claim the oldest shard which is pending or whose lease has expired
+        :param owner: id of the worker
+        :param lease_seconds: Duration of the lease
+        :return The claimed shard, or None if there is nothing to claim
+        """
+        now = time.time()
+        with self.connection:
+            # Take the write lock first so that two workers never claim the same shard
+            self.connection.execute("BEGIN IMMEDIATE")
+            # Expired leases which have used up their attempts are given up
+            self.connection.execute("""
+                UPDATE shards SET status = 'failed', error = COALESCE(error, 'lease expired')
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            """, (now, self.max_attempts))
+            row = self.connection.execute("""
+                SELECT id, kind, payload, attempts FROM shards
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                return None
+
+            shard_id, kind, payload, attempts = row
+            self.connection.execute("""
+                UPDATE shards SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            """, (owner, now + lease_seconds, shard_id))
+
+        return Shard(shard_id=shard_id, kind=kind, payload=json.loads(payload), owner=owner, attempts=attempts + 1)
+
+    def renew(self, shard: Shard, lease_seconds: float = 300) -> bool:
+        """
+        Extend the lease of a shard which takes long to process
+        :param shard: The claimed shard
+        :param lease_seconds: Duration of the lease from now
+        :return Whether the lease is still held, i.e., not expired and reassigned to another worker
+        """
+        cursor = self.connection.execute("""
+            UPDATE shards SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'leased'
+        """, (time.time() + lease_seconds, shard.shard_id, shard.owner))
+
+        return cursor.rowcount == 1
+
+    def complete(self, shard: Shard, result: dict = None) -> bool:
+        """
+        Mark a shard as done
+        :param shard: The claimed shard
+        :param result: JSON serialisable result of the work
+        :return Whether the result is accepted, i.e., the lease is still held
+        """
+        cursor = self.connection.execute("""
+            UPDATE shards SET status = 'done', result = ?, error = NULL, lease_expires = NULL
+            WHERE id = ? AND owner = ? AND status = 'leased'
+        """, (json.dumps(result), shard.shard_id, shard.owner))
+
+        return cursor.rowcount == 1
+
+    def fail(self, shard: Shard, error: Exception | str) -> None:
+        """
+        Give a shard back after an error, it is retried unless it has used up its attempts
+        :param shard: The claimed shard
+        :param error: The exception encountered
+        """
+        status = "failed" if shard.attempts >= self.max_attempts else "pending"
+        self.connection.execute("""
+            UPDATE shards SET status = ?, error = ?, owner = NULL, lease_expires = NULL
+            WHERE id = ? AND owner = ? AND status = 'leased'
+        """, (status, repr(error), shard.shard_id, shard.owner))
+
+    def counts(self) -> Dict[str, int]:
+        """
+        :return Number of shards per status
+        """
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+
+    def is_drained(self) -> bool:
+        """
+        :return Whether no shard is pending or leased
+        """
+        return self.connection.execute("""
+            SELECT 1 FROM shards WHERE status IN ('pending', 'leased') LIMIT 1
+        """).fetchone() is None
+
+    def iter_results(self, kind: str) -> Iterator[Tuple[dict, dict]]:
+        """
+        Iterate the completed shards of a kind
+        :param kind: Kind of the shard
+        :return An iterator of (payload, result)
+        """
+        for payload, result in self.connection.execute("""
+            SELECT payload, result FROM shards WHERE kind = ? AND status = 'done' ORDER BY id
+        """, (kind,)):
+            yield json.loads(payload), json.loads(result)
+
+    def iter_failures(self) -> Iterator[Tuple[str, dict, str]]:
+        """
+        Iterate the shards which have used up their attempts
+        :return An iterator of (kind, payload, error)
+        """
+        for kind, payload, error in self.connection.execute("""
+            SELECT kind, payload, error FROM shards WHERE status = 'failed' ORDER BY id
+        """):
+            yield kind, json.loads(payload), error